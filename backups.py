@@ -0,0 +1,151 @@
+"""Content-addressed store of the files install replaced.
+
+Each distinct version of a file is stored once, named by its SHA-256, so
+backing up a file that was seen before costs nothing. New versions are hard
+links to the file about to be replaced whenever possible, since install
+replaces files with renames and leaves the old inode to the store.
+"""
+import json
+import logging
+import os
+import shutil
+from typing import Iterable
+
+from cache import load_json, save_text
+from fingerprints import hash_file
+
+logger = logging.getLogger(__name__)
+
+BACKUPS_NAME = ".ghidra-dark-backups"
+MAX_HISTORY = 5
+
+
+def link_or_copy(source: str, destination: str):
+    """Keep `source`'s current contents at `destination`, for free if possible"""
+    try:
+        os.remove(destination)
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+class BackupStore:
+    """Distinct earlier versions of the files below `directory`.
+
+    The first version of each file is kept for good, later ones are evicted
+    oldest first once there are more than `max_history`.
+    """
+
+    def __init__(self, directory: str, max_history: int = MAX_HISTORY):
+        self.directory = directory
+        self.path = os.path.join(directory, BACKUPS_NAME)
+        self.index_path = os.path.join(self.path, "index.json")
+        self.max_history = max(max_history, 1)
+        # Path relative to `directory` to its digests, oldest first
+        self.history = load_json(self.index_path).get("files", {})
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.path, "objects", digest)
+
+    def _chown_like_directory(self, path: str):
+        # Owned by the user, not root, when installing for someone else
+        if hasattr(os, "chown"):
+            st = os.stat(self.directory)
+            try:
+                os.chown(path, st.st_uid, st.st_gid)
+            except PermissionError:
+                pass
+
+    def has(self, digest: str) -> bool:
+        """Check if a version is stored.
+
+        Args:
+            digest (str): SHA-256 hex digest.
+
+        Returns:
+            bool: If it can be restored.
+        """
+        return os.path.exists(self._object_path(digest))
+
+    def add(self, path: str) -> str:
+        """Store the current contents of `path`.
+
+        Args:
+            path (str): File below `directory`.
+
+        Returns:
+            str: SHA-256 hex digest to restore it by.
+        """
+        digest = hash_file(path)
+        object_path = self._object_path(digest)
+        if not os.path.exists(object_path):
+            objects_path = os.path.dirname(object_path)
+            if not os.path.isdir(objects_path):
+                os.makedirs(objects_path)
+                self._chown_like_directory(self.path)
+                self._chown_like_directory(objects_path)
+            tmp_path = f"{object_path}.tmp"
+            link_or_copy(path, tmp_path)
+            st = os.stat(path)
+            if hasattr(os, "chown"):
+                try:
+                    os.chown(tmp_path, st.st_uid, st.st_gid)
+                except PermissionError:
+                    pass
+            os.replace(tmp_path, object_path)
+            logger.debug("Backed up %s as %s", path, digest)
+        else:
+            logger.debug("%s is already backed up as %s", path, digest)
+
+        history = self.history.setdefault(os.path.relpath(path, self.directory), [])
+        if digest in history[1:]:
+            history.remove(digest)
+        if digest not in history:
+            history.append(digest)
+        return digest
+
+    def restore(self, digest: str, destination: str):
+        """Copy a stored version to `destination`.
+
+        The store keeps its own copy, in case the restored file is edited in place.
+
+        Args:
+            digest (str): SHA-256 hex digest from `add`.
+            destination (str): Path to write.
+        """
+        object_path = self._object_path(digest)
+        shutil.copy2(object_path, destination)
+        st = os.stat(object_path)
+        if hasattr(os, "chown"):
+            try:
+                os.chown(destination, st.st_uid, st.st_gid)
+            except PermissionError:
+                pass
+
+    def save(self, keep: Iterable[str] = ()):
+        """Evict old versions and write the index.
+
+        Args:
+            keep (Iterable[str], optional): Digests that must not be evicted.
+                Defaults to ().
+        """
+        keep = set(keep)
+        for history in self.history.values():
+            evictable = [_ for _ in history[1:] if _ not in keep]
+            for digest in evictable[: max(len(history) - self.max_history, 0)]:
+                history.remove(digest)
+        text = json.dumps({"files": self.history}, indent=2)
+        save_text(self.index_path, text, like=self.directory)
+
+        referenced = keep.union(*self.history.values())
+        try:
+            names = os.listdir(os.path.dirname(self._object_path("")))
+        except FileNotFoundError:
+            names = []
+        for name in names:
+            if name not in referenced:
+                os.remove(self._object_path(name))
+                logger.debug("Evicted %s", name)
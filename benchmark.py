@@ -0,0 +1,282 @@
+"""Benchmark the tool config parsing and rewriting paths."""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+from tcd_browser import SplicingTCDBrowser, StreamingTCDBrowser, TCDBrowser
+from preferences import preferences, Wrapped
+import install
+
+
+logger = logging.getLogger(__name__)
+
+# Name to (categories, options per category)
+SIZES = {
+    "tiny": (3, 5),
+    "small": (20, 50),
+    "medium": (100, 100),
+    "large": (250, 100),
+    "huge": (500, 100),
+}
+
+
+def generate_tcd(path: str, categories: int, options: int, seed: int = 0):
+    """Write a synthetic tool config with `categories` x `options` options.
+
+    Roughly half of the theme's options are already present so `update`
+    exercises both the insert and the update paths.
+
+    Args:
+        path (str): Output path.
+        categories (int): Number of option categories.
+        options (int): Number of options per category.
+        seed (int, optional): Random seed. Defaults to 0.
+    """
+    rng = random.Random(seed)
+    root = ET.Element("TOOL_CONFIG", CONFIG_NAME="NO_LONGER_USED")
+    ET.SubElement(
+        root, "SUPPORTED_DATA_TYPE", CLASS_NAME="ghidra.program.model.listing.Program"
+    )
+    tool = ET.SubElement(root, "TOOL", TOOL_NAME="CodeBrowser", INSTANCE_NAME="")
+    tool_options = ET.SubElement(tool, "OPTIONS")
+
+    names = list(preferences.keys()) + [f"Category {_}" for _ in range(categories)]
+    for name in names[:categories]:
+        category = ET.SubElement(tool_options, "CATEGORY", NAME=name)
+        themed = {
+            option: value
+            for option, value in preferences.get(name, {}).items()
+            if rng.random() < 0.5
+        }
+        for option, value in themed.items():
+            # Same shape as the theme's option so update takes the existing path
+            if isinstance(value, Wrapped):
+                wrapped = ET.SubElement(
+                    category, value.tag, NAME=option, CLASS=value.classname
+                )
+                for state in value.states:
+                    ET.SubElement(
+                        wrapped, state.tag, NAME=state.name, TYPE=state.type, VALUE="0"
+                    )
+            else:
+                ET.SubElement(
+                    category, value.tag, NAME=option, TYPE=value.type, VALUE="0"
+                )
+        for option in (f"Option {_}" for _ in range(options - len(themed))):
+            if rng.random() < 0.5:
+                wrapped = ET.SubElement(
+                    category,
+                    "WRAPPED_OPTION",
+                    NAME=option,
+                    CLASS="ghidra.framework.options.WrappedColor",
+                )
+                value = str(rng.randint(-(2 ** 31), 2 ** 31 - 1))
+                ET.SubElement(wrapped, "STATE", NAME="color", TYPE="int", VALUE=value)
+            else:
+                value = str(rng.random() < 0.5).lower()
+                ET.SubElement(
+                    category, "STATE", NAME=option, TYPE="boolean", VALUE=value
+                )
+
+    # Some window layout so the rest of the document is not empty
+    node = ET.SubElement(tool, "ROOT_NODE", X_POS="0", Y_POS="0", WIDTH="1280")
+    for _ in range(options):
+        ET.SubElement(node, "COMPONENT_INFO", NAME=f"Provider {_}", OWNER="Plugin")
+
+    # Round trip through TCDBrowser so the layout matches Ghidra's
+    ET.ElementTree(root).write(path, encoding="UTF-8", xml_declaration=True)
+    browser = TCDBrowser(path)
+    browser._indent(browser.root)
+    browser.write()
+
+
+def _measure(func, setup=None, repeat: int = 3) -> dict:
+    """Run `func` `repeat` times, returning the best wall time and peak memory"""
+    best = None
+    peak = 0
+    for _ in range(repeat):
+        state = setup() if setup else None
+        tracemalloc.start()
+        start = time.perf_counter()
+        func(state)
+        elapsed = time.perf_counter() - start
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        best = elapsed if best is None else min(best, elapsed)
+    return {"seconds": best, "peak_bytes": peak}
+
+
+def bench_size(workdir: str, name: str, repeat: int) -> dict:
+    """Benchmark every path for one synthetic config size.
+
+    Args:
+        workdir (str): Scratch directory.
+        name (str): Key of `SIZES`.
+        repeat (int): Runs per measurement, the fastest is kept.
+
+    Returns:
+        dict: Measurement name to wall time and peak memory.
+    """
+    categories, options = SIZES[name]
+    source = os.path.join(workdir, f"{name}.tcd")
+    generate_tcd(source, categories, options)
+
+    def fresh_copy():
+        path = os.path.join(workdir, f"{name}.work.tcd")
+        shutil.copyfile(source, path)
+        return path
+
+    def parsed():
+        return TCDBrowser(fresh_copy())
+
+    def updated():
+        browser = parsed()
+        browser.update(preferences)
+        return browser
+
+    def config_dir():
+        config_path = os.path.join(workdir, f"{name}.config")
+        shutil.rmtree(config_path, ignore_errors=True)
+        os.makedirs(os.path.join(config_path, "tools"))
+        with open(os.path.join(config_path, "preferences"), "w") as fp:
+            fp.write("LastLookAndFeel=System\n")
+        tcd_path = os.path.join(config_path, "tools", "_code_browser.tcd")
+        shutil.copyfile(source, tcd_path)
+        return config_path
+
+    results = {
+        "options": categories * options,
+        "bytes": os.path.getsize(source),
+        "parse": _measure(TCDBrowser, fresh_copy, repeat),
+        "update": _measure(lambda _: _.update(preferences), parsed, repeat),
+        "serialize": _measure(lambda _: _.write(), updated, repeat),
+        "stream": _measure(
+            lambda _: StreamingTCDBrowser(_).update(preferences), fresh_copy, repeat
+        ),
+        "splice": _measure(
+            lambda _: SplicingTCDBrowser(_).update(preferences), fresh_copy, repeat
+        ),
+        "install": _measure(install.install_dark_preferences, config_dir, repeat),
+    }
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Find measurements that regressed against a baseline.
+
+    Args:
+        results (dict): Current results.
+        baseline (dict): Saved baseline results.
+        tolerance (float): Allowed slowdown or growth factor (e.g. 1.25).
+
+    Returns:
+        list: Human readable regression messages.
+    """
+    regressions = []
+    for size, measurements in results["sizes"].items():
+        for phase, current in measurements.items():
+            saved = baseline.get("sizes", {}).get(size, {}).get(phase)
+            if not isinstance(current, dict) or not saved:
+                continue
+            for metric in ("seconds", "peak_bytes"):
+                if saved[metric] and current[metric] > saved[metric] * tolerance:
+                    regressions.append(
+                        f"{size} {phase} {metric}: {current[metric]:.6g} "
+                        f"(baseline {saved[metric]:.6g})"
+                    )
+    return regressions
+
+
+def main(args: argparse.Namespace):
+    """Run the benchmarks
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+    """
+    if args.debug:
+        level = logging.DEBUG
+    else:
+        level = logging.ERROR
+    logging.basicConfig(level=level, format="%(levelname)s: %(message)s")
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sizes": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="ghidra-dark-bench-") as workdir:
+        for name in args.sizes:
+            measurements = bench_size(workdir, name, args.repeat)
+            results["sizes"][name] = measurements
+            print(
+                f"{name} ({measurements['options']} options, "
+                f"{measurements['bytes']} bytes)"
+            )
+            phases = ("parse", "update", "serialize", "stream", "splice", "install")
+            for phase in phases:
+                m = measurements[phase]
+                print(
+                    f"  {phase:10} {m['seconds'] * 1000:10.2f} ms "
+                    f"{m['peak_bytes'] / 1024:10.0f} KiB peak"
+                )
+
+    if args.save:
+        with open(args.save, "w") as fp:
+            json.dump(results, fp, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r") as fp:
+            baseline = json.load(fp)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ghidra-dark")
+    parser.add_argument(
+        "-d", "--debug", action="store_true", help="turn on debug logging"
+    )
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        choices=SIZES.keys(),
+        default=list(SIZES.keys()),
+        help="synthetic config sizes to run",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="runs per measurement, fastest is kept"
+    )
+    parser.add_argument(
+        "--save",
+        type=str,
+        default=None,
+        metavar="JSON",
+        help="save results as a baseline",
+    )
+    parser.add_argument(
+        "--compare",
+        type=str,
+        default=None,
+        metavar="JSON",
+        help="fail if results regress against this baseline",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.25,
+        help="allowed slowdown factor when comparing (default: 1.25)",
+    )
+
+    main(parser.parse_args())
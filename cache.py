@@ -0,0 +1,80 @@
+"""Small on-disk caches shared between runs."""
+import json
+import os
+import stat
+import tempfile
+
+
+def get_cache_dir() -> str:
+    """Find the ghidra-dark cache directory.
+
+    Returns:
+        str: Cache directory, e.g. `~/.cache/ghidra-dark`.
+    """
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "ghidra-dark")
+
+
+def load_json(path: str) -> dict:
+    """Load a JSON cache file.
+
+    Args:
+        path (str): Cache file path.
+
+    Returns:
+        dict: The cached data, or an empty dict if it is missing or corrupt.
+    """
+    try:
+        with open(path, "r") as fp:
+            data = json.load(fp)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def save_text(path: str, text: str, like: str = None):
+    """Atomically write a text file, creating its directory if needed.
+
+    Args:
+        path (str): File path.
+        text (str): New contents.
+        like (str, optional): Take the owner, and the mode if it is a file, from
+            this path. Defaults to `path` itself, if it exists.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    try:
+        st = os.stat(like or path)
+    except OSError:
+        st = None
+    fd, tmp_path = tempfile.mkstemp(prefix=".ghidra-dark-", suffix=".tmp", dir=directory)
+    try:
+        with open(fd, "w", newline="") as fp:
+            fp.write(text)
+        # mkstemp is private to us, the file is not
+        if st and stat.S_ISREG(st.st_mode):
+            os.chmod(tmp_path, stat.S_IMODE(st.st_mode))
+        else:
+            os.chmod(tmp_path, 0o644)
+        if st and hasattr(os, "chown"):
+            try:
+                os.chown(tmp_path, st.st_uid, st.st_gid)
+            except PermissionError:
+                pass
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def save_json(path: str, data: dict):
+    """Atomically write a JSON cache file.
+
+    Args:
+        path (str): Cache file path.
+        data (dict): Data to cache.
+    """
+    save_text(path, json.dumps(data, indent=2))
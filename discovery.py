@@ -0,0 +1,260 @@
+"""Discover Ghidra installations."""
+import argparse
+import logging
+import os
+from pathlib import Path
+import re
+import shutil
+import sys
+from typing import List, NamedTuple, Tuple
+
+from cache import get_cache_dir, load_json, save_json
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+if os.name == "nt":
+    DEFAULT_ROOTS = [os.environ.get("ProgramFiles", "C:\\Program Files"), "C:\\"]
+else:
+    DEFAULT_ROOTS = ["/opt", "/usr/share", "/usr/local", "/usr/lib"]
+
+
+class GhidraInstall(NamedTuple):
+    path: str
+    version: str
+
+
+def add_discovery_arguments(parser: argparse.ArgumentParser):
+    """Add the install discovery options shared by install and uninstall.
+
+    Args:
+        parser (argparse.ArgumentParser): Entry point argument parser.
+    """
+    parser.add_argument(
+        "-a",
+        "--all",
+        action="store_true",
+        help="run for every Ghidra installation that can be found",
+    )
+    parser.add_argument(
+        "--root",
+        dest="roots",
+        action="append",
+        default=None,
+        metavar="DIR",
+        help="directory to search for Ghidra installations with --all (repeatable)",
+    )
+
+
+def get_ghidra_install_path(install_path: str = None) -> str:
+    """Find the Ghidra install path by using `which`.
+
+    Args:
+        install_path (str, optional): Ghidra install path. Defaults to None.
+
+    Returns:
+        str: Ghidra install path.
+    """
+    if install_path:
+        return install_path
+    # Attempt to find the installation directory based on `ghidraRun`
+    ghidra_run_path = shutil.which("ghidraRun")
+
+    if not ghidra_run_path:
+        # Arch package uses a symlink in `/usr/bin/ghidra` to ghidraRun
+        ghidra_symlink_path = shutil.which("ghidra")
+        if ghidra_symlink_path and os.path.islink(ghidra_symlink_path):
+            try:
+                ghidra_run_path = os.readlink(ghidra_symlink_path)
+            except:
+                ghidra_run_path = None
+
+    if not ghidra_run_path:
+        return None
+    return Path(ghidra_run_path).resolve().parents[0]
+
+
+def get_ghidra_version(install_path: str) -> str:
+    """Parse the version from the `application.properties` file.
+
+    Args:
+        install_path (str): Ghidra installation path; contains `application.properties`
+
+    Returns:
+        str: Ghidra Version (e.g. 9.2, 10.0-BETA).
+    """
+    # Get the version from the application.properties file
+    properties_path = os.path.join(install_path, "Ghidra", "application.properties")
+    with open(properties_path, "r") as fp:
+        for line in fp:
+            if "application.version=" in line:
+                return line.split("=")[-1].strip()
+    return ""
+
+
+def parse_version(version: str) -> Tuple[int, ...]:
+    """Turn a version string into a comparable tuple.
+
+    Args:
+        version (str): Ghidra Version (e.g. 9.2, 10.0-BETA).
+
+    Returns:
+        Tuple[int, ...]: Numeric parts of the version (e.g. (10, 0)).
+    """
+    return tuple(map(int, re.findall("[0-9]+", version)))
+
+
+def is_supported_version(version: str) -> bool:
+    """Check if ghidra-dark supports the Ghidra version.
+
+    Args:
+        version (str): Ghidra Version (e.g. 9.2, 10.0-BETA).
+
+    Returns:
+        bool: If the version is older than 10.3.
+    """
+    return parse_version(version) < (10, 3)
+
+
+def list_config_dirs(home: str, version: str = None) -> List[str]:
+    """List the Ghidra config directories in `home` with a single directory listing.
+
+    Args:
+        home (str): Home directory.
+        version (str, optional): Only list the variants for this Ghidra version
+            (e.g. `.ghidra_10.2_PUBLIC` and `.ghidra_10.2_DEV`), best match
+            first. Defaults to None.
+
+    Returns:
+        List[str]: Config directory names, inside `home/.ghidra`.
+    """
+    try:
+        with os.scandir(os.path.join(home, ".ghidra")) as it:
+            names = sorted(_.name for _ in it if _.name.startswith(".ghidra"))
+    except OSError:
+        names = []
+    logger.debug("Found Ghidra configs: %s", ", ".join(names) or "none")
+    if version is None:
+        return names
+
+    prefix = f".ghidra_{version}_"
+    variants = [_ for _ in names if _.startswith(prefix)]
+    # Releases are _PUBLIC and source builds _DEV, anything else is a last resort
+    return sorted(variants, key=lambda _: (_ != f"{prefix}PUBLIC", _ != f"{prefix}DEV"))
+
+
+def _scan_root(root: str) -> List[str]:
+    """List the Ghidra installs directly inside `root`, or `root` itself"""
+    candidates = [root]
+    try:
+        with os.scandir(root) as it:
+            candidates += sorted(_.path for _ in it if _.is_dir())
+    except OSError:
+        return []
+    return [
+        _
+        for _ in candidates
+        if os.path.isfile(os.path.join(_, "Ghidra", "application.properties"))
+    ]
+
+
+def discover_installs(
+    roots: List[str] = None, cache_path: str = None
+) -> List[GhidraInstall]:
+    """Find every Ghidra installation under `roots` and on the `PATH`.
+
+    Each root's results are cached along with its mtime, so a root is only
+    rescanned when something is added to or removed from it. Versions are
+    cached along with the mtime of `application.properties`.
+
+    Args:
+        roots (List[str], optional): Directories to search. Defaults to `DEFAULT_ROOTS`.
+        cache_path (str, optional): Discovery cache file. Defaults to the user cache.
+
+    Returns:
+        List[GhidraInstall]: Unique installations with their versions.
+    """
+    cache_path = cache_path or os.path.join(get_cache_dir(), "installs.json")
+    cache = load_json(cache_path)
+    cached_roots = cache.get("roots", {})
+    cached_versions = cache.get("versions", {})
+    changed = False
+
+    paths = []
+    on_path = get_ghidra_install_path()
+    if on_path:
+        paths.append(str(on_path))
+
+    for root in roots or DEFAULT_ROOTS:
+        root = os.path.abspath(os.path.expanduser(root))
+        try:
+            mtime_ns = os.stat(root).st_mtime_ns
+        except OSError:
+            continue
+        entry = cached_roots.get(root)
+        if not entry or entry.get("mtime_ns") != mtime_ns:
+            logger.debug("Scanning %s", root)
+            entry = {"mtime_ns": mtime_ns, "installs": _scan_root(root)}
+            cached_roots[root] = entry
+            changed = True
+        paths += entry["installs"]
+
+    installs = []
+    for path in dict.fromkeys(os.path.realpath(_) for _ in paths):
+        properties_path = os.path.join(path, "Ghidra", "application.properties")
+        try:
+            mtime_ns = os.stat(properties_path).st_mtime_ns
+        except OSError:
+            continue
+        entry = cached_versions.get(path)
+        if not entry or entry.get("mtime_ns") != mtime_ns:
+            entry = {"mtime_ns": mtime_ns, "version": get_ghidra_version(path)}
+            cached_versions[path] = entry
+            changed = True
+        installs.append(GhidraInstall(path, entry["version"]))
+        logger.debug("Found Ghidra v%s at %s", entry["version"], path)
+
+    if changed:
+        try:
+            save_json(cache_path, {"roots": cached_roots, "versions": cached_versions})
+        except OSError as e:
+            logger.debug("Could not save %s: %s", cache_path, e)
+    return installs
+
+
+def select_installs(args: argparse.Namespace) -> List[GhidraInstall]:
+    """Find the installations selected on the command line.
+
+    Every supported installation found with `--all`, otherwise the one at
+    `--path` or on the `PATH`. Exits if there is none.
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+
+    Returns:
+        List[GhidraInstall]: Installations with their versions.
+    """
+    if args.all:
+        installs = []
+        with metrics.span("phase_seconds", phase="discovery"):
+            discovered = discover_installs(args.roots)
+        for install in discovered:
+            if is_supported_version(install.version):
+                installs.append(install)
+            else:
+                logging.warning(
+                    "Skipping Ghidra v%s at %s", install.version, install.path
+                )
+        if not installs:
+            logging.error("Could not find any Ghidra installation, specify with --root")
+            sys.exit(-1)
+        return installs
+
+    with metrics.span("phase_seconds", phase="discovery"):
+        ghidra_install_path = get_ghidra_install_path(args.install_path)
+    if not ghidra_install_path:
+        logging.error("Could not find Ghidra installation, specify with --path")
+        sys.exit(-1)
+    with metrics.span("phase_seconds", phase="version"):
+        ghidra_version = get_ghidra_version(ghidra_install_path)
+    return [GhidraInstall(ghidra_install_path, ghidra_version)]
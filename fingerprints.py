@@ -0,0 +1,134 @@
+"""Fingerprints of themed tool files, used to skip files that are already up to date."""
+import hashlib
+import json
+import logging
+import os
+
+from cache import save_text
+from preferences import Wrapped
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINTS_NAME = ".ghidra-dark-fingerprints.json"
+
+
+def hash_preferences(preferences: dict) -> str:
+    """Hash the preferences so a theme change invalidates every fingerprint.
+
+    Args:
+        preferences (dict): Category to option name to option.
+
+    Returns:
+        str: SHA-256 hex digest.
+    """
+    canonical = {}
+    for category, options in preferences.items():
+        for name, option in options.items():
+            if isinstance(option, Wrapped):
+                value = [option.tag, option.classname]
+                value += [[_.tag, _.name, _.type, _.value] for _ in option.states]
+            else:
+                value = [option.tag, option.type, option.value]
+            canonical.setdefault(category, {})[name] = value
+    data = json.dumps(canonical, sort_keys=True).encode()
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path: str) -> str:
+    """Hash a file in chunks.
+
+    Args:
+        path (str): File to hash.
+
+    Returns:
+        str: SHA-256 hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Fingerprints:
+    """Size, mtime and hash of each tool file as it was left after theming."""
+
+    def __init__(self, config_path: str, preferences: dict):
+        self.path = os.path.join(config_path, FINGERPRINTS_NAME)
+        self.preferences_hash = hash_preferences(preferences)
+        self.files = {}
+        self.changed = False
+        try:
+            with open(self.path, "r") as fp:
+                data = json.load(fp)
+        except (OSError, ValueError):
+            return
+        if data.get("preferences") == self.preferences_hash:
+            self.files = data.get("files", {})
+        else:
+            logger.debug("Preferences changed, ignoring %s", self.path)
+
+    def is_current(self, path: str) -> bool:
+        """Check if `path` is unchanged since it was last themed.
+
+        A matching size and mtime is trusted as is; otherwise the file is hashed.
+
+        Args:
+            path (str): Tool file path.
+
+        Returns:
+            bool: If the file can be skipped.
+        """
+        entry = self.files.get(os.path.basename(path))
+        if not entry:
+            return False
+        try:
+            st = os.stat(path)
+            if st.st_size != entry["size"]:
+                return False
+            if st.st_mtime_ns == entry["mtime_ns"]:
+                return True
+            if hash_file(path) != entry["sha256"]:
+                return False
+        except OSError:
+            return False
+        # Touched but not modified, refresh the stat so next time is cheap
+        entry["mtime_ns"] = st.st_mtime_ns
+        self.changed = True
+        return True
+
+    def record(self, path: str):
+        """Remember the current contents of `path`.
+
+        Args:
+            path (str): Tool file path.
+        """
+        st = os.stat(path)
+        self.files[os.path.basename(path)] = {
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "sha256": hash_file(path),
+        }
+        self.changed = True
+
+    def save(self):
+        """Atomically write the fingerprints if anything changed."""
+        if not self.changed:
+            return
+        data = {"preferences": self.preferences_hash, "files": self.files}
+        # Owned by the user, not root, when installing for someone else
+        text = json.dumps(data, indent=2)
+        save_text(self.path, text, like=os.path.dirname(self.path))
+        self.changed = False
+
+
+def remove_fingerprints(config_path: str):
+    """Forget every fingerprint for `config_path`.
+
+    Args:
+        config_path (str): Ghidra config path.
+    """
+    try:
+        os.remove(os.path.join(config_path, FINGERPRINTS_NAME))
+    except FileNotFoundError:
+        pass
@@ -1,91 +1,295 @@
 """FlatLaf package handling."""
+import glob
+import hashlib
 import os
 import re
-import fileinput
 import logging
-from urllib.request import urlopen
+import shutil
+import tempfile
+
+from cache import get_cache_dir
+from fingerprints import hash_file
+from journal import Journal
+from locking import DEFAULT_TIMEOUT, lock_directory
+from properties import Properties
 
 logger = logging.getLogger(__name__)
 
+MAVEN_URL = "https://repo1.maven.org/maven2"
+SYSTEM_LAF = "-Dswing.systemlaf=com.formdev.flatlaf.FlatDarkLaf"
+# SHA-256 of the FlatLaf releases to trust without asking the repository, by
+# version. Others are checked against the SHA-1 published next to the jar.
+PINNED_SHA256 = {}
+
 
 class FlatLaf:
-    def __init__(self, version="2.0.2"):
+    def __init__(
+        self,
+        version="2.0.2",
+        base_url: str = None,
+        sha256: str = None,
+        cache_dir: str = None,
+        lock_timeout: float = DEFAULT_TIMEOUT,
+    ):
         self.version = version
+        self.lock_timeout = lock_timeout
+        self.base_url = (base_url or MAVEN_URL).rstrip("/")
+        sha256 = sha256 or PINNED_SHA256.get(version)
+        self.sha256 = sha256.lower() if sha256 else None
+        self.cache_dir = cache_dir or os.path.join(get_cache_dir(), "flatlaf")
+        self.published_sha1 = None
 
     def get_path(self, install_path: str):
         return os.path.join(install_path, "Ghidra/patch/", f"flatlaf-{self.version}.jar")
 
+    def is_installed(self, install_path: str) -> bool:
+        """Check if the jar is in place and set as the system L&f, without locking.
+
+        Args:
+            install_path (str): Ghidra install path.
+
+        Returns:
+            bool: If there is nothing left to install.
+        """
+        if not os.path.exists(self.get_path(install_path)):
+            return False
+        launch_properties_path = os.path.join(
+            install_path, "support", "launch.properties"
+        )
+        try:
+            vmargs = Properties(launch_properties_path).get_all("VMARGS")
+        except FileNotFoundError:
+            return False
+        return SYSTEM_LAF in vmargs
+
     def get_url(self):
         return (
-            f"https://repo1.maven.org/maven2/com/formdev/flatlaf/{self.version}/"
+            f"{self.base_url}/com/formdev/flatlaf/{self.version}/"
             f"flatlaf-{self.version}.jar"
         )
 
+    def get_published_sha1(self) -> str:
+        """Download the SHA-1 published next to the jar on the repository.
+
+        Returns:
+            str: SHA-1 hex digest.
+        """
+        if self.published_sha1 is None:
+            # Only needed when the jar is not pinned, and slow to import
+            from urllib.request import urlopen
+
+            with urlopen(f"{self.get_url()}.sha1") as connection:
+                self.published_sha1 = connection.read().decode().split()[0].lower()
+        return self.published_sha1
+
+    def is_release(self, path: str) -> bool:
+        """Check a jar against the pinned SHA-256, or the published SHA-1.
+
+        Never against the name of a cached jar, anyone who can write to the
+        cache can pick that.
+
+        Args:
+            path (str): Jar to check.
+
+        Returns:
+            bool: If it is the FlatLaf release.
+        """
+        if self.sha256:
+            return hash_file(path) == self.sha256
+        return _hash_sha1(path) == self.get_published_sha1()
+
+    def get_cached_path(self) -> str:
+        """Find the verified jar in the cache.
+
+        The jar is checked again before use, as anyone who can write to the
+        cache could have replaced it.
+
+        Returns:
+            str: Cached jar path, or None if it has not been fetched yet.
+        """
+        if self.sha256:
+            name = f"flatlaf-{self.version}-{self.sha256}.jar"
+            cached = [os.path.join(self.cache_dir, name)]
+        else:
+            name = f"flatlaf-{self.version}-*.jar"
+            cached = glob.glob(os.path.join(glob.escape(self.cache_dir), name))
+
+        for path in cached:
+            try:
+                if self.is_release(path):
+                    return path
+            except FileNotFoundError:
+                continue
+            logger.warning("Ignoring %s, it is not the FlatLaf release", path)
+        return None
+
+    def fetch(self) -> str:
+        """Download the jar into the cache, unless it is already there.
+
+        The jar is streamed to disk in chunks while hashing. It is checked against
+        the pinned SHA-256 if one was given, otherwise against the SHA-1 published
+        next to it on the repository.
+
+        Concurrent runs wait on the cache lock, so only the first downloads.
+
+        Returns:
+            str: Cached jar path.
+        """
+        cached_path = self.get_cached_path()
+        if cached_path:
+            logging.debug("FlatLaf already cached: %s", cached_path)
+            return cached_path
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with lock_directory(self.cache_dir, self.lock_timeout):
+            return self._download()
+
+    def _download(self) -> str:
+        """Download and verify the jar into the cache, holding its lock."""
+        # Another run may have fetched it while we waited for the lock
+        cached_path = self.get_cached_path()
+        if cached_path:
+            logging.debug("FlatLaf already cached: %s", cached_path)
+            return cached_path
+
+        # Only needed when downloading, and slow to import
+        from urllib.request import urlopen
+
+        flatlaf_url = self.get_url()
+        expected_sha1 = None if self.sha256 else self.get_published_sha1()
+
+        fd, tmp_path = tempfile.mkstemp(
+            prefix=".flatlaf-", suffix=".tmp", dir=self.cache_dir
+        )
+        try:
+            logging.debug("Downloading FlatLaf from %s", flatlaf_url)
+            sha256 = hashlib.sha256()
+            sha1 = hashlib.sha1()
+            with urlopen(flatlaf_url) as connection, open(fd, "wb") as fp:
+                for chunk in iter(lambda: connection.read(1 << 16), b""):
+                    sha256.update(chunk)
+                    sha1.update(chunk)
+                    fp.write(chunk)
+
+            digest = sha256.hexdigest()
+            if self.sha256 and digest != self.sha256:
+                raise ValueError(
+                    f"{flatlaf_url} has SHA-256 {digest}, expected {self.sha256}"
+                )
+            if expected_sha1 and sha1.hexdigest() != expected_sha1:
+                raise ValueError(
+                    f"{flatlaf_url} has SHA-1 {sha1.hexdigest()}, "
+                    f"expected {expected_sha1}"
+                )
+
+            name = f"flatlaf-{self.version}-{digest}.jar"
+            cached_path = os.path.join(self.cache_dir, name)
+            # Every user's Ghidra has to be able to load the jar
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, cached_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return cached_path
+
     def install(self, install_path: str, version: str):
         """Download (if necessary) and install FlatLaf.
 
         Args:
             install_path (str): Ghidra install path.
             version (str): Current Ghidra Version.
+
+        Raises:
+            LockTimeout: If another run kept the install path locked.
         """
-        # TODO: Refactor this duplicate code
-        version_number = ".".join(re.findall("[0-9]+", version))
-        version_number = tuple(map(int, (version_number.split("."))))
+        # Users can theme their own config against an install they cannot write
+        if self.is_installed(install_path):
+            logging.debug("FlatLaf already installed: %s", install_path)
+            return
 
-        flatlaf_path = self.get_path(install_path)
-        flatlaf_url = self.get_url()
+        with lock_directory(install_path, self.lock_timeout):
+            journal = Journal(install_path)
+            journal.recover()
 
-        # Download the FlatLaf jar
-        if not os.path.exists(flatlaf_path):
-            logging.debug("Downloading FlatLaf")
-            with urlopen(flatlaf_url) as connection:
-                with open(flatlaf_path, "wb") as fp:
-                    fp.write(connection.read())
-        else:
-            logging.debug("Flatlaf already downloaded: %s", flatlaf_path)
+            # TODO: Refactor this duplicate code
+            version_number = ".".join(re.findall("[0-9]+", version))
+            version_number = tuple(map(int, (version_number.split("."))))
 
-        launch_properties_path = os.path.join(
-            install_path, "support", "launch.properties"
-        )
+            flatlaf_path = self.get_path(install_path)
+
+            # Copy the cached FlatLaf jar into the install, a link would let
+            # whoever owns the cache change the jar every user's Ghidra loads
+            if not os.path.exists(flatlaf_path):
+                staged_path = journal.stage(flatlaf_path)
+                try:
+                    # Never write through a link left by an interrupted run
+                    os.remove(staged_path)
+                except FileNotFoundError:
+                    pass
+                cached_path = self.fetch()
+                shutil.copyfile(cached_path, staged_path)
+                if not self.is_release(staged_path):
+                    raise ValueError(f"{cached_path} changed while it was copied")
+                os.chmod(staged_path, 0o644)
+                if hasattr(os, "chown"):
+                    st = os.stat(install_path)
+                    try:
+                        os.chown(staged_path, st.st_uid, st.st_gid)
+                    except PermissionError:
+                        pass
+                logging.debug("Installing %s", flatlaf_path)
+            else:
+                logging.debug("Flatlaf already downloaded: %s", flatlaf_path)
 
-        # Check if FlatLaf is the system L&f
-        flatlaf_set = False
-        with open(launch_properties_path, "r") as fp:
-            for line in fp:
-                if "flatlaf" in line:
-                    flatlaf_set = True
-                    break
-
-        # Set FlatLaf as the system L&f
-        if not flatlaf_set:
-            with open(launch_properties_path, "a") as fp:
+            launch_properties_path = os.path.join(
+                install_path, "support", "launch.properties"
+            )
+
+            # Set FlatLaf as the system L&f
+            launch_properties = Properties(launch_properties_path)
+            launch_properties.add("VMARGS", SYSTEM_LAF)
+            if launch_properties.save(journal):
                 logging.debug("Setting FlatLaf as system L&f")
-                fp.write("\nVMARGS=-Dswing.systemlaf=com.formdev.flatlaf.FlatDarkLaf")
+
+            journal.commit()
 
     def remove(self, install_path: str):
         """Remove the flatlaf jar and remove it from launch files.
 
         Args:
             install_path (str): Ghidra install path.
+
+        Raises:
+            LockTimeout: If another run kept the install path locked.
         """
+        with lock_directory(install_path, self.lock_timeout):
+            launch_properties_path = os.path.join(
+                install_path, "support", "launch.properties"
+            )
 
-        flatlaf_path = self.get_path(install_path)
-        try:
-            os.remove(flatlaf_path)
-            logger.debug("Removed %s", flatlaf_path)
-        except FileNotFoundError:
-            logger.warning("Could not remove %s", flatlaf_path)
+            journal = Journal(install_path)
+            if journal.exists():
+                # Admins edit launch.properties too, only the install's entry goes
+                journal.restore(exclude=[launch_properties_path])
+                logger.debug("Restored %s from its journal", install_path)
+            else:
+                flatlaf_path = self.get_path(install_path)
+                try:
+                    os.remove(flatlaf_path)
+                    logger.debug("Removed %s", flatlaf_path)
+                except FileNotFoundError:
+                    logger.warning("Could not remove %s", flatlaf_path)
+
+            launch_properties = Properties(launch_properties_path)
+            launch_properties.remove("VMARGS", SYSTEM_LAF)
+            if launch_properties.save():
+                logging.debug("Restored %s", launch_properties_path)
 
-        launch_properties_path = os.path.join(
-            install_path, "support", "launch.properties"
-        )
 
-        with fileinput.FileInput(launch_properties_path, inplace=True) as fp:
-            for line in fp:
-                if (
-                    "VMARGS=-Dswing.systemlaf=com.formdev.flatlaf.FlatDarkLaf"
-                    not in line
-                ):
-                    print(line, end="")
-                else:
-                    logging.debug("Restored %s", launch_properties_path)
+def _hash_sha1(path: str) -> str:
+    """Hash a file in chunks, like `fingerprints.hash_file` but with SHA-1"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
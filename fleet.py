@@ -0,0 +1,199 @@
+"""Fleet mode: apply the theme to many users' Ghidra configs at once."""
+import argparse
+import glob
+import logging
+import os
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+from metrics import metrics
+from processes import get_user_uid, has_proc, is_ghidra_running, iter_ghidra_processes
+
+logger = logging.getLogger(__name__)
+
+
+class FleetResult(NamedTuple):
+    home: str
+    config_path: str
+    ok: bool
+    message: str
+    metrics: dict = None
+    profile: dict = None
+
+
+def add_fleet_arguments(parser: argparse.ArgumentParser, parallel: bool = True):
+    """Add the fleet mode options shared by install, uninstall and status.
+
+    Args:
+        parser (argparse.ArgumentParser): Entry point argument parser.
+        parallel (bool, optional): If the entry point runs each home in a worker
+            process, adding `--jobs`. Defaults to True.
+    """
+    parser.add_argument(
+        "--users",
+        nargs="+",
+        default=None,
+        metavar="USER",
+        help="run for each of these users" + (" in parallel" if parallel else ""),
+    )
+    parser.add_argument(
+        "--homes",
+        type=str,
+        default=None,
+        metavar="GLOB",
+        help="run for every home directory matching this glob (e.g. '/home/*')",
+    )
+    if parallel:
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=None,
+            help="number of worker processes in fleet mode",
+        )
+
+
+def is_fleet(args: argparse.Namespace) -> bool:
+    """Check if the command line asked for fleet mode.
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+
+    Returns:
+        bool: If `--users` or `--homes` was given.
+    """
+    return bool(args.users or args.homes)
+
+
+def get_fleet_homes(users: List[str] = None, home_glob: str = None) -> List[str]:
+    """Resolve the users and home directory glob to a list of home directories.
+
+    Args:
+        users (List[str], optional): User names. Defaults to None.
+        home_glob (str, optional): Home directory glob. Defaults to None.
+
+    Returns:
+        List[str]: Unique home directories, in the order given.
+    """
+    homes = []
+    for user in users or []:
+        home = os.path.expanduser(f"~{user}")
+        if home.startswith("~"):
+            logger.warning("Unknown user %s", user)
+            continue
+        homes.append(home)
+    if home_glob:
+        homes.extend(sorted(_ for _ in glob.glob(home_glob) if os.path.isdir(_)))
+    return list(dict.fromkeys(homes))
+
+
+def _run_one(
+    action: Callable[[str], None], home: str, config_path: str, profile: bool = False
+) -> FleetResult:
+    """Run `action` for a single config path, capturing any failure and metrics."""
+    # Workers are forked with, and reused across, other users' metrics
+    metrics.reset()
+    if profile:
+        from profiling import profiler
+
+        profiler.start()
+    try:
+        action(config_path)
+    except SystemExit as e:
+        # The single user code paths log the reason and exit
+        ok, message = False, f"exited with status {e.code}"
+    except Exception as e:  # pylint: disable=broad-except
+        ok, message = False, f"{type(e).__name__}: {e}"
+    else:
+        ok, message = True, ""
+    return FleetResult(
+        home,
+        config_path,
+        ok,
+        message,
+        metrics.to_dict(),
+        profiler.to_dict() if profile else None,
+    )
+
+
+def run_fleet(
+    action: Callable[[str], None], config_paths: Dict[str, str], jobs: int = None
+) -> List[FleetResult]:
+    """Run `action` for every config path across a pool of worker processes.
+
+    Args:
+        action (Callable[[str], None]): Picklable function taking a config path.
+        config_paths (Dict[str, str]): Home directory to Ghidra config path.
+        jobs (int, optional): Number of workers. Defaults to the CPU count.
+
+    Returns:
+        List[FleetResult]: One result per home directory, in the order given.
+    """
+    if not config_paths:
+        return []
+    from concurrent.futures import ProcessPoolExecutor
+    from profiling import profiler
+
+    jobs = min(jobs or os.cpu_count() or 1, len(config_paths))
+    logger.debug("Running %d configs with %d workers", len(config_paths), jobs)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(_run_one, action, home, config_path, profiler.enabled)
+            for home, config_path in config_paths.items()
+        ]
+        results = [future.result() for future in futures]
+    for result in results:
+        metrics.merge(result.metrics)
+        if result.profile:
+            profiler.merge(result.profile)
+    return results
+
+
+def log_summary(results: List[FleetResult]) -> bool:
+    """Print a per-user summary of a fleet run.
+
+    Args:
+        results (List[FleetResult]): Results from `run_fleet`.
+
+    Returns:
+        bool: If every user succeeded.
+    """
+    failed = [_ for _ in results if not _.ok]
+    for result in results:
+        if result.ok:
+            print(f"ok     {result.home}")
+        else:
+            print(f"FAILED {result.home}: {result.message}")
+    print(f"{len(results) - len(failed)} succeeded, {len(failed)} failed")
+    return not failed
+
+
+def exclude_running(
+    config_paths: Dict[str, str], install_path: str
+) -> Tuple[Dict[str, str], List[FleetResult]]:
+    """Hold back every home whose owner is running Ghidra from `install_path`.
+
+    Args:
+        config_paths (Dict[str, str]): Home directory to Ghidra config path.
+        install_path (str): Ghidra install path.
+
+    Returns:
+        Tuple[Dict[str, str], List[FleetResult]]: The config paths that are safe to
+            modify and a failed result for each one that is not.
+    """
+    if has_proc():
+        running = set(iter_ghidra_processes(install_path=install_path))
+    elif is_ghidra_running():
+        # Without /proc there is no way to tell whose Ghidra is running
+        running = None
+    else:
+        running = set()
+
+    ready = {}
+    blocked = []
+    for home, config_path in config_paths.items():
+        if running is None or get_user_uid(home=home) in running:
+            message = "Ghidra is running, please close it"
+            blocked.append(FleetResult(home, config_path, False, message))
+        else:
+            ready[home] = config_path
+    return ready, blocked
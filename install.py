@@ -1,80 +1,49 @@
 """Install Ghidra dark theme."""
 import argparse
-import fileinput
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+import functools
 import logging
 import os
 from pathlib import Path
 import re
-import shutil
-import subprocess
 import sys
+from typing import Callable, List
 
-from tcd_browser import TCDBrowser, TCD_LIST
+from tcd_browser import TCD_LIST, for_each_tool_file, list_tool_files, open_tool_file
 from preferences import preferences
+from themes import get_theme
 from flatlaf import FlatLaf
+from fingerprints import Fingerprints
+from journal import Journal
+from locking import DEFAULT_TIMEOUT, LockTimeout, add_lock_arguments, lock_directory
+from properties import Properties
+import fleet
+from metrics import add_metrics_arguments, metrics
+from profiling import add_profile_arguments, profiler
+from processes import is_ghidra_running, get_user_uid
+from watch import add_watch_arguments, watch
+from discovery import add_discovery_arguments, list_config_dirs, select_installs
 
 
 logger = logging.getLogger(__name__)
 
 
-def is_ghidra_running() -> bool:
-    """Check if `ghidrarun` is running.
-
-    Returns:
-        bool: If Ghidra is running.
-    """
-    if os.name == "nt":
-        find_ghidra = "WMIC path win32_process get Commandline"
-    else:
-        find_ghidra = "ps -ax"
-    out = subprocess.check_output(find_ghidra.split())
-    logger.debug("Running %s", find_ghidra)
-    if b"ghidrarun" in out.lower():
-        return True
-    return False
-
-
-def get_ghidra_install_path(install_path: str = None) -> str:
-    """Find the Ghidra install path by using `which`.
-
-    Args:
-        install_path (str, optional): Ghidra install path. Defaults to None.
-
-    Returns:
-        str: Ghidra install path.
-    """
-    if install_path:
-        return install_path
-    # Attempt to find the installation directory based on `ghidraRun`
-    ghidra_run_path = shutil.which("ghidraRun")
-
-    if not ghidra_run_path:
-        # Arch package uses a symlink in `/usr/bin/ghidra` to ghidraRun
-        ghidra_symlink_path = shutil.which("ghidra")
-        if ghidra_symlink_path and os.path.islink(ghidra_symlink_path):
-            try:
-                ghidra_run_path = os.readlink(ghidra_symlink_path)
-            except:
-                ghidra_run_path = None
-
-    if not ghidra_run_path:
-        return None
-    return Path(ghidra_run_path).resolve().parents[0]
-
-
-def get_ghidra_config_path(version: str, user: str = None) -> str:
+def get_ghidra_config_path(version: str, user: str = None, home: str = None) -> str:
     """Find the Ghidra config path based off of `version` and `user`.
 
     Args:
         version (str): The current version of Ghidra.
         user (str, optional): The user's home to search. Defaults to None.
+        home (str, optional): The home directory to search, overrides `user`.
+            Defaults to None.
 
     Returns:
         str: Ghidra config path.
     """
-    if user:
+    if not home and user:
         home = os.path.expanduser(f"~{user}")
-    else:
+    elif not home:
         home = Path.home()
     logger.debug("Using home: %s", home)
 
@@ -82,10 +51,16 @@ def get_ghidra_config_path(version: str, user: str = None) -> str:
     # The "-" after .ghidra was changed to "_" after 9.0.4
     version_number = ".".join(re.findall("[0-9]+", version))
     if tuple(map(int, (version_number.split(".")))) > (9, 0, 4):
-        version_path = f".ghidra_{version}_PUBLIC"
         # _DEV when built from source, or from some repos (Arch, Kali, etc.)
-        if not os.path.exists(os.path.join(home, ".ghidra", version_path)):
-            version_path = f".ghidra_{version}_DEV"
+        variants = list_config_dirs(home, version)
+        version_path = variants[0] if variants else f".ghidra_{version}_DEV"
+        if len(variants) > 1:
+            logger.warning(
+                "Found configs %s for Ghidra v%s, using %s",
+                ", ".join(variants),
+                version,
+                version_path,
+            )
     else:
         version_path = f".ghidra-{version}"
 
@@ -98,63 +73,342 @@ def get_ghidra_config_path(version: str, user: str = None) -> str:
     return os.path.join(home, ".ghidra", version_path)
 
 
-def get_ghidra_version(install_path: str) -> str:
-    """Parse the version from the `application.properties` file.
+def _install_tool_file(
+    config_path: str,
+    theme_preferences: dict,
+    fingerprints: Fingerprints,
+    journal: Journal,
+    tcd: str,
+    splice: bool = False,
+):
+    """Stage a modified copy of one tool file, unless it is already up to date.
 
     Args:
-        install_path (str): Ghidra installation path; contains `application.properties`
-
-    Returns:
-        str: Ghidra Version (e.g. 9.2, 10.0-BETA).
+        config_path (str): Ghidra config path.
+        theme_preferences (dict): Category to option name to option.
+        fingerprints (Fingerprints): Fingerprints of the config's tool files.
+        journal (Journal): Journal of the config path.
+        tcd (str): Tool file name from `TCD_LIST`.
+        splice (bool, optional): Only patch the values that changed. Defaults
+            to False.
     """
-    # Get the version from the application.properties file
-    properties_path = os.path.join(install_path, "Ghidra", "application.properties")
-    with open(properties_path, "r") as fp:
-        for line in fp:
-            if "application.version=" in line:
-                return line.split("=")[-1].strip()
-    return ""
-
-
-def install_dark_preferences(config_path: str):
-    """Backup and modify preference files to use dark colors.
+    tcd_path = os.path.join(config_path, "tools", tcd)
+    if fingerprints.is_current(tcd_path):
+        logging.debug("%s is already up to date", tcd)
+        metrics.add("files_skipped", config=config_path, file=tcd)
+        return
+    labels = {"config": config_path, "file": tcd}
+    with metrics.span("file_seconds", **labels), profiler.file(tcd_path):
+        browser = open_tool_file(tcd_path, splice)
+        browser.update(theme_preferences, journal.stage(tcd_path))
+    metrics.add("options_added", browser.added, **labels)
+    metrics.add("options_updated", browser.updated, **labels)
+    metrics.add("bytes_written", browser.bytes_written, **labels)
+
+
+def install_dark_preferences(
+    config_path: str,
+    theme: str = None,
+    tcds: List[str] = None,
+    lock_timeout: float = DEFAULT_TIMEOUT,
+    before_commit: Callable[[], None] = None,
+    splice: bool = False,
+):
+    """Modify preference files to use dark colors.
+
+    Every change is staged first and committed together through the config
+    path's journal, so a failure leaves the previous files in place.
 
     Args:
         config_path (str): Ghidra config path.
+        theme (str, optional): Theme file to use instead of the built-in
+            preferences. Defaults to None.
+        tcds (List[str], optional): Only modify these tool files. Defaults to
+            every file in `TCD_LIST`.
+        lock_timeout (float, optional): Seconds to wait for another run on the
+            config path. Defaults to `DEFAULT_TIMEOUT`.
+        before_commit (Callable[[], None], optional): Called once everything
+            is staged, nothing is committed if it raises. Defaults to None.
+        splice (bool, optional): Only patch the tool file values that changed,
+            keeping Ghidra's layout. Defaults to False.
+
+    Raises:
+        LockTimeout: If another run kept the config path locked.
     """
-    preferences_path = os.path.join(config_path, "preferences")
-    if not os.path.exists(preferences_path):
+    theme_preferences = get_theme(theme) if theme else preferences
+    with ExitStack() as stack:
+        try:
+            stack.enter_context(lock_directory(config_path, lock_timeout))
+        except FileNotFoundError:
+            # The lock file goes in the config path, Ghidra creates it on first run
+            logging.error("Please open Ghidra at least once to fully install dark mode.")
+            sys.exit(-1)
+        _install_locked(config_path, theme_preferences, tcds, before_commit, splice)
+
+
+def _install_locked(
+    config_path: str,
+    theme_preferences: dict,
+    tcds: List[str],
+    before_commit: Callable[[], None],
+    splice: bool,
+):
+    """Stage and commit the changes of `install_dark_preferences`, once locked."""
+    journal = Journal(config_path)
+    journal.recover()
+
+    # Set the L&f to system
+    try:
+        ghidra_preferences = Properties(os.path.join(config_path, "preferences"))
+    except FileNotFoundError:
         logging.error("Please open Ghidra at least once to fully install dark mode.")
         sys.exit(-1)
+    ghidra_preferences.set("LastLookAndFeel", "System")
+    ghidra_preferences.save(journal)
+
+    # Stage the modified tcd and tool files, listing them once instead of
+    # checking each one, which is slow on network home directories
+    requested = TCD_LIST if tcds is None else tcds
+    present = list_tool_files(config_path)
+    fingerprints = Fingerprints(config_path, theme_preferences)
+    errors = for_each_tool_file(
+        functools.partial(
+            _install_tool_file,
+            config_path,
+            theme_preferences,
+            fingerprints,
+            journal,
+            splice=splice,
+        ),
+        [_ for _ in requested if _ in present],
+    )
 
-    # Check if the current L&f is system
-    using_system = False
-    with open(preferences_path, "r") as fp:
-        for line in fp:
-            if "LastLookAndFeel=System" in line:
-                using_system = True
-                break
-
-    # Set the L&f to system
-    if not using_system:
-        with open(preferences_path, "a") as fp:
-            fp.write("LastLookAndFeel=System\n")
-
-    # Backup and modify the current tcd and tool files
-    for tcd in TCD_LIST:
-        tcd_path = os.path.join(config_path, "tools", tcd)
-        backup_path = os.path.join(config_path, "tools", f"{tcd}.bak")
-        try:
-            shutil.copy(tcd_path, backup_path)
-            browser = TCDBrowser(tcd_path)
-            browser.update(preferences)
-        except FileNotFoundError:
+    failed = False
+    for tcd in requested:
+        if tcd in present and tcd not in errors:
+            continue
+        if tcd not in present or isinstance(errors[tcd], FileNotFoundError):
             if tcd == "_code_browser.tcd":
                 logging.warning(
                     "Please open Ghidra at least once to fully install dark mode."
                 )
             else:
                 logging.debug("Could not open %s", tcd)
+        else:
+            logging.error("Could not modify %s: %s", tcd, errors[tcd])
+            failed = True
+    if failed:
+        journal.discard()
+        sys.exit(-1)
+
+    if before_commit is not None:
+        try:
+            before_commit()
+        except BaseException:
+            journal.discard()
+            raise
+
+    tools_path = os.path.join(config_path, "tools")
+    modified = [_ for _ in journal.staged if os.path.dirname(_) == tools_path]
+    journal.commit()
+    for tcd_path in modified:
+        fingerprints.record(tcd_path)
+    fingerprints.save()
+
+
+def install_theme(
+    args: argparse.Namespace, ghidra_install_path: str, ghidra_version: str
+) -> bool:
+    """Install Ghidra dark theme for one Ghidra installation
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+        ghidra_install_path (str): Ghidra install path.
+        ghidra_version (str): Ghidra version of the installation.
+
+    Returns:
+        bool: If every user was themed.
+    """
+    span = functools.partial(
+        metrics.span, "phase_seconds", install=str(ghidra_install_path)
+    )
+    flatlaf = _get_flatlaf(args)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # Download the jar while the users' files are checked and staged
+        fetching = None
+        if not os.path.exists(flatlaf.get_path(ghidra_install_path)):
+            fetching = executor.submit(_fetch_flatlaf, flatlaf, span)
+        installed = []
+
+        def install_flatlaf():
+            if installed:
+                return
+            installed.append(flatlaf)
+            logging.debug("Installing FlatLaf...")
+            with span(phase="flatlaf"):
+                if fetching is not None:
+                    fetching.result()
+                flatlaf.install(ghidra_install_path, ghidra_version)
+
+        try:
+            if fleet.is_fleet(args):
+                return _install_fleet(
+                    args, ghidra_install_path, ghidra_version, install_flatlaf
+                )
+
+            with span(phase="process_detection"):
+                uid = get_user_uid(args.user)
+                running = is_ghidra_running(uid, ghidra_install_path)
+            if running:
+                logger.error("Please close any running Ghidra instances.")
+                return False
+            ghidra_config_path = get_ghidra_config_path(ghidra_version, args.user)
+            logging.debug("Using Ghidra config path %s", ghidra_config_path)
+
+            logging.debug("Installing dark preferences...")
+            try:
+                with span(phase="preferences"):
+                    install_dark_preferences(
+                        ghidra_config_path,
+                        args.theme,
+                        lock_timeout=args.lock_timeout,
+                        before_commit=install_flatlaf,
+                        splice=args.splice,
+                    )
+            finally:
+                # Even if the preferences could not be installed
+                install_flatlaf()
+        except LockTimeout as e:
+            logger.error("%s, try again once it is done.", e)
+            return False
+    return True
+
+
+def _get_flatlaf(args: argparse.Namespace) -> FlatLaf:
+    """Set up FlatLaf from the command line options."""
+    return FlatLaf(
+        base_url=args.flatlaf_url,
+        sha256=args.flatlaf_sha256,
+        lock_timeout=args.lock_timeout,
+    )
+
+
+def _fetch_flatlaf(flatlaf: FlatLaf, span: Callable) -> str:
+    """Download the FlatLaf jar into the cache, timing it as its own phase."""
+    with span(phase="flatlaf_download"):
+        return flatlaf.fetch()
+
+
+def _install_fleet(
+    args: argparse.Namespace,
+    ghidra_install_path: str,
+    ghidra_version: str,
+    install_flatlaf: Callable[[], None],
+) -> bool:
+    """Install Ghidra dark theme for every user of the fleet options.
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+        ghidra_install_path (str): Ghidra install path.
+        ghidra_version (str): Ghidra version of the installation.
+        install_flatlaf (Callable[[], None]): Installs FlatLaf once its
+            download is done.
+
+    Returns:
+        bool: If every user was themed.
+    """
+    span = functools.partial(
+        metrics.span, "phase_seconds", install=str(ghidra_install_path)
+    )
+    homes = fleet.get_fleet_homes(args.users, args.homes)
+    config_paths = {
+        home: get_ghidra_config_path(ghidra_version, home=home) for home in homes
+    }
+    with span(phase="process_detection"):
+        config_paths, blocked = fleet.exclude_running(config_paths, ghidra_install_path)
+
+    # The workers commit on their own, so FlatLaf goes first
+    install_flatlaf()
+
+    logging.debug("Installing dark preferences...")
+    with span(phase="preferences"):
+        action = functools.partial(
+            install_dark_preferences,
+            theme=args.theme,
+            lock_timeout=args.lock_timeout,
+            splice=args.splice,
+        )
+        results = fleet.run_fleet(action, config_paths, args.jobs)
+    return fleet.log_summary(blocked + results)
+
+
+def install_all(args: argparse.Namespace) -> bool:
+    """Install Ghidra dark theme for the selected Ghidra installations
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+
+    Returns:
+        bool: If every installation and user succeeded.
+    """
+    if args.theme:
+        try:
+            get_theme(args.theme)
+        except (OSError, ValueError, ImportError) as e:
+            logging.error("Could not load theme: %s", e)
+            sys.exit(-1)
+
+    if args.watch and (args.all or fleet.is_fleet(args)):
+        logging.error("--watch works with a single user and installation")
+        sys.exit(-1)
+
+    installs = select_installs(args)
+
+    ok = True
+    for ghidra_install_path, ghidra_version in installs:
+        logging.debug("Using Ghidra install path %s", ghidra_install_path)
+        logging.debug("Found Ghidra v%s", ghidra_version)
+        if args.all and fleet.is_fleet(args):
+            print(f"Ghidra v{ghidra_version} ({ghidra_install_path})")
+        ok = install_theme(args, ghidra_install_path, ghidra_version) and ok
+
+    if args.watch:
+        ghidra_config_path = get_ghidra_config_path(ghidra_version, args.user)
+        uid = get_user_uid(args.user)
+        pending = None
+        flatlaf = None
+        if not ok:
+            # Ghidra was running, apply everything, FlatLaf too, once it exits
+            pending = [os.path.join(ghidra_config_path, "tools", _) for _ in TCD_LIST]
+            flatlaf = _get_flatlaf(args)
+
+        def apply(tcds: List[str]):
+            nonlocal flatlaf, ok
+            install_flatlaf = None
+            if flatlaf is not None:
+                install_flatlaf = functools.partial(
+                    flatlaf.install, ghidra_install_path, ghidra_version
+                )
+            install_dark_preferences(
+                ghidra_config_path,
+                args.theme,
+                tcds,
+                args.lock_timeout,
+                before_commit=install_flatlaf,
+                splice=args.splice,
+            )
+            flatlaf = None
+            ok = True
+
+        watch(
+            ghidra_config_path,
+            apply,
+            lambda: is_ghidra_running(uid, ghidra_install_path),
+            args.debounce,
+            pending=pending,
+        )
+
+    return ok
 
 
 def main(args: argparse.Namespace):
@@ -169,29 +423,19 @@ def main(args: argparse.Namespace):
         level = logging.WARNING
     logging.basicConfig(level=level, format="%(levelname)s: %(message)s")
 
-    if is_ghidra_running():
-        logger.error("Please close any running Ghidra instances.")
+    if args.profile:
+        profiler.start()
+    try:
+        ok = install_all(args)
+    finally:
+        if args.metrics:
+            metrics.write(args.metrics, args.metrics_format)
+        if args.profile:
+            profiler.write(args.profile)
+
+    if not ok:
         sys.exit(-1)
 
-    ghidra_install_path = get_ghidra_install_path(args.install_path)
-    if not ghidra_install_path:
-        logging.error("Could not find Ghidra installation, specify with --path")
-        sys.exit(-1)
-    logging.debug("Using Ghidra install path %s", ghidra_install_path)
-
-    ghidra_version = get_ghidra_version(ghidra_install_path)
-    logging.debug("Found Ghidra v%s", ghidra_version)
-
-    ghidra_config_path = get_ghidra_config_path(ghidra_version, args.user)
-    logging.debug("Using Ghidra config path %s", ghidra_config_path)
-
-    logging.debug("Installing FlatLaf...")
-    flatlaf = FlatLaf()
-    flatlaf.install(ghidra_install_path, ghidra_version)
-
-    logging.debug("Installing dark preferences...")
-    install_dark_preferences(ghidra_config_path)
-
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Install Ghidra dark theme")
@@ -209,5 +453,35 @@ if __name__ == "__main__":
     parser.add_argument(
         "-u", "--user", type=str, default=None, help="the user to install for"
     )
+    parser.add_argument(
+        "-t",
+        "--theme",
+        type=str,
+        default=None,
+        help="JSON or TOML theme file to use instead of the built-in theme",
+    )
+    parser.add_argument(
+        "--splice",
+        action="store_true",
+        help="only patch the tool file values that changed, keeping their layout",
+    )
+    parser.add_argument(
+        "--flatlaf-url",
+        type=str,
+        default=None,
+        help="Maven repository to fetch FlatLaf from, may be a file:// mirror",
+    )
+    parser.add_argument(
+        "--flatlaf-sha256",
+        type=str,
+        default=None,
+        help="expected SHA-256 of the FlatLaf jar",
+    )
+    add_discovery_arguments(parser)
+    add_metrics_arguments(parser)
+    add_profile_arguments(parser)
+    add_lock_arguments(parser)
+    fleet.add_fleet_arguments(parser)
+    add_watch_arguments(parser)
 
     main(parser.parse_args())
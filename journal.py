@@ -0,0 +1,172 @@
+"""Transactional install journal.
+
+New file contents are staged next to the files they replace and committed
+together with renames. Every version that gets replaced goes to the backup
+store first. The journal remembers the one from before the first install, so
+uninstalling puts that version back, and the ones from before the current
+commit, so recovering from a crash partway through it puts those back.
+"""
+import json
+import logging
+import os
+import threading
+from typing import Iterable
+
+from backups import BackupStore
+from cache import load_json, save_text
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_NAME = ".ghidra-dark-journal.json"
+STAGED_SUFFIX = ".ghidra-dark-new"
+
+
+class Journal:
+    """Every file install touched below `directory`, and how to put it back."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, JOURNAL_NAME)
+        data = load_json(self.path)
+        # Path relative to `directory` to the digest of its original in the
+        # backup store, or None if it was created
+        self.files = data.get("files", {})
+        self.store = BackupStore(directory)
+        self.committing = data.get("state") == "committing"
+        # Same as `files`, but for the versions replaced by the current commit
+        self.pending = data.get("pending", {}) if self.committing else {}
+        self.staged = []
+        self._lock = threading.Lock()
+
+    def exists(self) -> bool:
+        """Check if anything was ever committed.
+
+        Returns:
+            bool: If there is something to restore.
+        """
+        return bool(self.files)
+
+    def _abspath(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _save(self, state: str):
+        data = {"state": state, "files": self.files}
+        if state == "committing":
+            data["pending"] = self.pending
+        save_text(self.path, json.dumps(data, indent=2), like=self.directory)
+
+    def stage(self, path: str) -> str:
+        """Reserve the staging path for the new contents of `path`.
+
+        Args:
+            path (str): File below `directory` that will be replaced.
+
+        Returns:
+            str: Where to write the new contents.
+        """
+        staged_path = f"{path}{STAGED_SUFFIX}"
+        with self._lock:
+            self.staged.append(path)
+        return staged_path
+
+    def stage_text(self, path: str, text: str):
+        """Stage new text contents for `path`, keeping its mode and owner.
+
+        Args:
+            path (str): File below `directory` that will be replaced.
+            text (str): New contents.
+        """
+        like = path if os.path.exists(path) else os.path.dirname(path)
+        save_text(self.stage(path), text, like=like)
+
+    def discard(self):
+        """Throw away everything staged and not committed yet."""
+        for path in self.staged:
+            try:
+                os.remove(f"{path}{STAGED_SUFFIX}")
+            except FileNotFoundError:
+                pass
+        self.staged = []
+
+    def commit(self):
+        """Move every staged file into place.
+
+        The backups and the journal are written before anything is renamed, so
+        a crash leaves enough behind for `recover` to restore the original files.
+        """
+        if not self.staged:
+            return
+        self.pending = {}
+        for path in self.staged:
+            name = os.path.relpath(path, self.directory)
+            digest = self.store.add(path) if os.path.exists(path) else None
+            self.files.setdefault(name, digest)
+            self.pending[name] = digest
+        digests = list(self.files.values()) + list(self.pending.values())
+        self.store.save(keep=(_ for _ in digests if _))
+        self._save("committing")
+
+        for path in self.staged:
+            os.replace(f"{path}{STAGED_SUFFIX}", path)
+            logger.debug("Committed %s", path)
+
+        self.pending = {}
+        self._save("committed")
+        self.staged = []
+
+    def _put_back(self, versions: dict):
+        """Put each file back to a version from the backup store, or remove it"""
+        for name, digest in versions.items():
+            path = self._abspath(name)
+            if digest is None:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                logger.debug("Removed %s", path)
+            elif self.store.has(digest):
+                staged_path = f"{path}{STAGED_SUFFIX}"
+                self.store.restore(digest, staged_path)
+                os.replace(staged_path, path)
+                logger.debug("Restored %s", path)
+            else:
+                logger.warning("No backup of %s to restore", path)
+
+    def restore(self, exclude: Iterable[str] = ()):
+        """Put every file back the way it was before the first install.
+
+        Args:
+            exclude (Iterable[str], optional): Files below `directory` to leave
+                as they are, for the caller to undo its own edits to. Defaults
+                to none.
+        """
+        excluded = {os.path.relpath(_, self.directory) for _ in exclude}
+        self._put_back(
+            {name: _ for name, _ in self.files.items() if name not in excluded}
+        )
+        self.files = {}
+        self.committing = False
+        self.pending = {}
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def recover(self):
+        """Roll back an interrupted commit to the files from before it, if any."""
+        if not self.committing:
+            return
+        logger.warning("Rolling back an interrupted install in %s", self.directory)
+        for name in self.pending:
+            try:
+                os.remove(f"{self._abspath(name)}{STAGED_SUFFIX}")
+            except FileNotFoundError:
+                pass
+        self._put_back(self.pending)
+        if self.files == self.pending:
+            # It was the first install, there is nothing left to uninstall
+            self.restore()
+            return
+        self.committing = False
+        self.pending = {}
+        self._save("committed")
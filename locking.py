@@ -0,0 +1,115 @@
+"""Advisory file locks, so runs against the same files do not interleave.
+
+Each config directory and each Ghidra install is locked separately, so runs
+for different users only wait on each other for the install they share.
+"""
+import argparse
+from contextlib import contextmanager
+import errno
+import logging
+import os
+import time
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+logger = logging.getLogger(__name__)
+
+LOCK_NAME = ".ghidra-dark.lock"
+DEFAULT_TIMEOUT = 60.0
+POLL_INTERVAL = 0.1
+
+
+class LockTimeout(Exception):
+    """Another run held a lock for longer than the timeout."""
+
+
+def add_lock_arguments(parser: argparse.ArgumentParser):
+    """Add the locking option shared by install and uninstall.
+
+    Args:
+        parser (argparse.ArgumentParser): Entry point argument parser.
+    """
+    parser.add_argument(
+        "--lock-timeout",
+        type=float,
+        default=DEFAULT_TIMEOUT,
+        metavar="SECONDS",
+        help="how long to wait for another run on the same files, 0 fails right "
+        f"away (default: {DEFAULT_TIMEOUT:g})",
+    )
+
+
+def _try_lock(fd: int) -> bool:
+    try:
+        if os.name == "nt":
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+def _unlock(fd: int):
+    if os.name == "nt":
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+@contextmanager
+def lock_directory(directory: str, timeout: float = DEFAULT_TIMEOUT):
+    """Hold the lock of a directory for the body of a `with` statement.
+
+    The lock file is left in place, removing it would race with other runs. A
+    directory the lock file cannot be created in is not locked, as nothing in it
+    can be changed by this run either.
+
+    Args:
+        directory (str): Config directory or Ghidra install path.
+        timeout (float, optional): Seconds to wait for another run to release
+            it. Defaults to `DEFAULT_TIMEOUT`.
+
+    Raises:
+        LockTimeout: If the lock is still held after `timeout`.
+    """
+    path = os.path.join(directory, LOCK_NAME)
+    # flock works on read-only files, so a lock file left by root for another
+    # user's config can still be locked by that user
+    flags = os.O_RDWR if os.name == "nt" else os.O_RDONLY
+    try:
+        fd = os.open(path, flags | os.O_CREAT, 0o644)
+    except OSError as e:
+        if e.errno not in (errno.EACCES, errno.EPERM, errno.EROFS):
+            raise
+        logger.debug("Not locking read-only %s", directory)
+        yield
+        return
+    try:
+        if hasattr(os, "chown"):
+            st = os.stat(directory)
+            try:
+                os.chown(path, st.st_uid, st.st_gid)
+            except PermissionError:
+                pass
+
+        deadline = time.monotonic() + timeout
+        if not _try_lock(fd):
+            logger.info("Waiting for another run to release %s", path)
+            while not _try_lock(fd):
+                if time.monotonic() >= deadline:
+                    raise LockTimeout(
+                        f"{directory} is locked by another run (waited {timeout:g}s)"
+                    )
+                time.sleep(POLL_INTERVAL)
+        logger.debug("Locked %s", path)
+        try:
+            yield
+        finally:
+            _unlock(fd)
+    finally:
+        os.close(fd)
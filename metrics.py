@@ -0,0 +1,173 @@
+"""Timing spans and counters for install and uninstall runs."""
+import argparse
+from contextlib import contextmanager
+import json
+import threading
+import time
+
+from cache import save_text
+
+PREFIX = "ghidra_dark"
+
+HELP = {
+    "phase_seconds": "Wall time spent in each phase of the run.",
+    "file_seconds": "Wall time spent on each tool file.",
+    "options_added": "Options added to tool files.",
+    "options_updated": "Options updated in tool files.",
+    "bytes_written": "Bytes written to tool files.",
+    "files_skipped": "Tool files skipped because they were already themed.",
+}
+
+
+def add_metrics_arguments(parser: argparse.ArgumentParser):
+    """Add the metrics export options shared by install and uninstall.
+
+    Args:
+        parser (argparse.ArgumentParser): Entry point argument parser.
+    """
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        default=None,
+        metavar="PATH",
+        help="write timings and counts of the run to PATH",
+    )
+    parser.add_argument(
+        "--metrics-format",
+        choices=["json", "prometheus"],
+        default=None,
+        help="metrics file format, prometheus for *.prom files and json otherwise",
+    )
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return (name, tuple(sorted(labels.items())))
+
+
+def _escape_label(value) -> str:
+    value = str(value).replace("\\", "\\\\").replace("\n", "\\n")
+    return value.replace('"', '\\"')
+
+
+class Metrics:
+    """Thread safe registry of timing spans and counters.
+
+    Spans and counters with the same name and labels are summed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        with self._lock:
+            self.started = time.time()
+            self.seconds = {}
+            self.counters = {}
+
+    @contextmanager
+    def span(self, name: str, **labels):
+        """Time the body of a `with` statement.
+
+        Args:
+            name (str): Metric name (e.g. `phase_seconds`).
+            **labels: Labels identifying the span (e.g. `phase="flatlaf"`).
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                key = _key(name, labels)
+                self.seconds[key] = self.seconds.get(key, 0.0) + elapsed
+
+    def add(self, name: str, value: float = 1, **labels):
+        """Increase a counter.
+
+        Args:
+            name (str): Metric name (e.g. `options_added`).
+            value (float, optional): Amount to add. Defaults to 1.
+            **labels: Labels identifying the counter.
+        """
+        with self._lock:
+            key = _key(name, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def to_dict(self) -> dict:
+        """Export everything recorded so far.
+
+        Returns:
+            dict: JSON serializable spans and counters.
+        """
+        with self._lock:
+            return {
+                "started": self.started,
+                "seconds": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in self.seconds.items()
+                ],
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in self.counters.items()
+                ],
+            }
+
+    def merge(self, data: dict):
+        """Add the spans and counters exported by another process.
+
+        Args:
+            data (dict): Output of `to_dict`.
+        """
+        for entry in data.get("seconds", []):
+            with self._lock:
+                key = _key(entry["name"], entry["labels"])
+                self.seconds[key] = self.seconds.get(key, 0.0) + entry["value"]
+        for entry in data.get("counters", []):
+            self.add(entry["name"], entry["value"], **entry["labels"])
+
+    def to_prometheus(self) -> str:
+        """Format everything recorded so far for the node exporter textfile collector.
+
+        Returns:
+            str: Prometheus text exposition format.
+        """
+        data = self.to_dict()
+        families = {}
+        for entry in data["seconds"] + data["counters"]:
+            families.setdefault(entry["name"], []).append(entry)
+
+        lines = []
+        for name, entries in sorted(families.items()):
+            metric = f"{PREFIX}_{name}"
+            lines.append(f"# HELP {metric} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {metric} gauge")
+            for entry in entries:
+                labels = ",".join(
+                    f'{key}="{_escape_label(value)}"'
+                    for key, value in sorted(entry["labels"].items())
+                )
+                lines.append(f"{metric}{{{labels}}} {entry['value']}")
+        lines.append(f"# HELP {PREFIX}_last_run_timestamp_seconds Start of the last run.")
+        lines.append(f"# TYPE {PREFIX}_last_run_timestamp_seconds gauge")
+        lines.append(f"{PREFIX}_last_run_timestamp_seconds {data['started']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str, metrics_format: str = None):
+        """Atomically write everything recorded so far.
+
+        Args:
+            path (str): Output path.
+            metrics_format (str, optional): `json` or `prometheus`. Defaults to
+                `prometheus` for `*.prom` paths and `json` otherwise.
+        """
+        if not metrics_format:
+            metrics_format = "prometheus" if path.endswith(".prom") else "json"
+        if metrics_format == "prometheus":
+            save_text(path, self.to_prometheus())
+        else:
+            save_text(path, json.dumps(self.to_dict(), indent=2))
+
+
+metrics = Metrics()
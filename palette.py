@@ -0,0 +1,306 @@
+"""Derive theme variants by transforming every color of a theme at once.
+
+The colors of a preferences tree are gathered into one NumPy array, so each
+transform is a handful of array operations whatever the number of colors.
+Variants are described as transform settings, e.g.::
+
+    {
+        "warm": {"hue": -15, "brightness": 0.02},
+        "deutan": {"colorblind": "deutan", "min_contrast": 4.5}
+    }
+
+and written as theme files for `install.py --theme`. Needs `numpy`.
+"""
+import argparse
+import json
+import os
+from typing import Iterable, List, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from preferences import Color
+
+# Machado et al. (2009) simulation of full dichromacy, on linear RGB
+DEFICIENCIES = {
+    "protan": [
+        [0.152286, 1.052583, -0.204868],
+        [0.114503, 0.786281, 0.099216],
+        [-0.003882, -0.048116, 1.051998],
+    ],
+    "deutan": [
+        [0.367322, 0.860646, -0.227968],
+        [0.280085, 0.672501, 0.047413],
+        [-0.011820, 0.042940, 0.968881],
+    ],
+    "tritan": [
+        [1.255528, -0.076749, -0.178779],
+        [-0.078411, 0.930809, 0.147602],
+        [0.004733, 0.691367, 0.303900],
+    ],
+}
+# Where the color information lost to each deficiency is moved to
+CORRECTIONS = {
+    "protan": [[0, 0, 0], [0.7, 1, 0], [0.7, 0, 1]],
+    "deutan": [[0, 0, 0], [0.7, 1, 0], [0.7, 0, 1]],
+    "tritan": [[1, 0, 0.7], [0, 1, 0.7], [0, 0, 0]],
+}
+LUMINANCE = (0.2126, 0.7152, 0.0722)
+# Luminance with the same contrast against black and white
+MID_LUMINANCE = 0.179
+# Hue rotation matrix as gray + cos(angle) * cos + sin(angle) * sin, like CSS
+HUE_ROTATION = (
+    [[0.213, 0.715, 0.072]] * 3,
+    [[0.787, -0.715, -0.072], [-0.213, 0.285, -0.072], [-0.213, -0.715, 0.928]],
+    [[-0.213, -0.715, 0.928], [0.143, 0.140, -0.283], [-0.787, 0.715, 0.072]],
+)
+# Transform settings, applied in this order by `Palette.apply`
+SETTINGS = ("brightness", "contrast", "hue", "colorblind", "min_contrast")
+
+
+def _to_linear(rgb):
+    return np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+
+
+def _to_srgb(linear):
+    linear = np.clip(linear, 0, 1)
+    return np.where(
+        linear <= 0.0031308, linear * 12.92, 1.055 * linear ** (1 / 2.4) - 0.055
+    )
+
+
+def _luminance(rgb):
+    return _to_linear(rgb) @ np.array(LUMINANCE)
+
+
+class Palette:
+    """Every color of a preferences tree, as RGB floats in [0, 1] and alpha.
+
+    Transforms return a new palette and leave this one alone.
+    """
+
+    def __init__(self, keys: List[Tuple[str, str]], rgb, alpha):
+        if np is None:
+            raise ImportError("palettes need `numpy`")
+        self.keys = keys
+        self.rgb = rgb
+        self.alpha = alpha
+
+    @classmethod
+    def from_preferences(cls, preferences: dict) -> "Palette":
+        """Gather the colors of a preferences tree.
+
+        Args:
+            preferences (dict): Category to option name to option.
+
+        Returns:
+            Palette: The colors, in tree order.
+        """
+        if np is None:
+            raise ImportError("palettes need `numpy`")
+        keys = [
+            (category, name)
+            for category, options in preferences.items()
+            for name, option in options.items()
+            if isinstance(option, Color)
+        ]
+        values = [int(preferences[c][n].states[0].value) for c, n in keys]
+        argb = np.array(values, dtype=np.int64).reshape(-1) & 0xFFFFFFFF
+        channels = (argb[:, None] >> np.array([16, 8, 0])) & 0xFF
+        return cls(keys, channels / 255.0, (argb >> 24) & 0xFF)
+
+    def _with_rgb(self, rgb) -> "Palette":
+        return Palette(self.keys, np.clip(rgb, 0, 1), self.alpha)
+
+    def argb(self) -> List[int]:
+        """Encode the colors the way Ghidra stores them.
+
+        Returns:
+            List[int]: Signed 32-bit ARGB values, in `keys` order.
+        """
+        channels = np.rint(self.rgb * 255).astype(np.int64)
+        argb = (self.alpha << 24) | (channels << np.array([16, 8, 0])).sum(axis=1)
+        return np.where(argb & 0x80000000, argb - (1 << 32), argb).tolist()
+
+    def backgrounds(self):
+        """Find the background colors by option name.
+
+        Returns:
+            numpy.ndarray: Mask of the colors named like a background.
+        """
+        return np.array(["Background" in name for _, name in self.keys], dtype=bool)
+
+    def adjust(self, brightness: float = 0.0, contrast: float = 1.0) -> "Palette":
+        """Scale the distance from mid gray, then shift every channel.
+
+        Args:
+            brightness (float, optional): Added to each channel. Defaults to 0.0.
+            contrast (float, optional): Contrast factor. Defaults to 1.0.
+
+        Returns:
+            Palette: The adjusted palette.
+        """
+        return self._with_rgb((self.rgb - 0.5) * contrast + 0.5 + brightness)
+
+    def rotate_hue(self, degrees: float) -> "Palette":
+        """Rotate every hue around the gray axis, keeping luminance.
+
+        Args:
+            degrees (float): Rotation angle.
+
+        Returns:
+            Palette: The rotated palette.
+        """
+        gray, cos, sin = (np.array(_) for _ in HUE_ROTATION)
+        radians = np.radians(degrees)
+        matrix = gray + np.cos(radians) * cos + np.sin(radians) * sin
+        return self._with_rgb(self.rgb @ matrix.T)
+
+    def daltonize(self, deficiency: str) -> "Palette":
+        """Move the color differences a deficiency hides to ones it keeps.
+
+        Args:
+            deficiency (str): "protan", "deutan" or "tritan".
+
+        Returns:
+            Palette: The remapped palette.
+        """
+        simulation = np.array(DEFICIENCIES[deficiency])
+        correction = np.array(CORRECTIONS[deficiency])
+        error = self.rgb - _to_srgb(_to_linear(self.rgb) @ simulation.T)
+        return self._with_rgb(self.rgb + error @ correction.T)
+
+    def enforce_contrast(self, minimum: float = 4.5, backgrounds=None) -> "Palette":
+        """Lighten (or darken) colors until they reach a WCAG contrast ratio.
+
+        Each color is checked against the background it contrasts least with,
+        and moved toward white on dark backgrounds or black on light ones.
+        Backgrounds and colors that are themselves highlights are left alone.
+
+        Args:
+            minimum (float, optional): Minimum contrast ratio. Defaults to 4.5.
+            backgrounds (numpy.ndarray, optional): Mask of the background
+                colors. Defaults to `backgrounds()`.
+
+        Returns:
+            Palette: The adjusted palette.
+        """
+        backgrounds = self.backgrounds() if backgrounds is None else backgrounds
+        if not backgrounds.any():
+            return self
+        fills = np.array(
+            [
+                any(_ in name for _ in ("Highlight", "Selection", "Cursor"))
+                for _, name in self.keys
+            ],
+            dtype=bool,
+        )
+        foregrounds = ~backgrounds & ~fills
+
+        background_luminance = _luminance(self.rgb[backgrounds])
+        darkest, lightest = background_luminance.min(), background_luminance.max()
+        linear = _to_linear(self.rgb)
+        luminance = linear @ np.array(LUMINANCE)
+        if lightest < MID_LUMINANCE:
+            target = minimum * (lightest + 0.05) - 0.05
+            amount = (target - luminance) / np.maximum(1 - luminance, 1e-9)
+            amount = np.where(foregrounds, np.clip(amount, 0, 1), 0)[:, None]
+            linear = linear + amount * (1 - linear)
+        elif darkest >= MID_LUMINANCE:
+            target = (darkest + 0.05) / minimum - 0.05
+            amount = 1 - target / np.maximum(luminance, 1e-9)
+            amount = np.where(foregrounds, np.clip(amount, 0, 1), 0)[:, None]
+            linear = linear * (1 - amount)
+        else:
+            # Both dark and light backgrounds, no single direction helps
+            return self
+        return self._with_rgb(_to_srgb(linear))
+
+    def apply(self, settings: dict) -> "Palette":
+        """Apply transform settings, in `SETTINGS` order.
+
+        Args:
+            settings (dict): Any of "brightness", "contrast", "hue",
+                "colorblind" and "min_contrast".
+
+        Returns:
+            Palette: The transformed palette.
+        """
+        unknown = set(settings) - set(SETTINGS)
+        if unknown:
+            raise ValueError(f"unknown settings {', '.join(sorted(unknown))}")
+        palette = self
+        if "brightness" in settings or "contrast" in settings:
+            palette = palette.adjust(
+                settings.get("brightness", 0.0), settings.get("contrast", 1.0)
+            )
+        if settings.get("hue"):
+            palette = palette.rotate_hue(settings["hue"])
+        if settings.get("colorblind"):
+            palette = palette.daltonize(settings["colorblind"])
+        if settings.get("min_contrast"):
+            palette = palette.enforce_contrast(settings["min_contrast"])
+        return palette
+
+    def to_preferences(self, preferences: dict) -> dict:
+        """Build a new preferences tree with this palette's colors.
+
+        Args:
+            preferences (dict): The tree the palette was gathered from.
+
+        Returns:
+            dict: Copy of `preferences` with every color replaced.
+        """
+        colors = dict(zip(self.keys, self.argb()))
+        return {
+            category: {
+                name: Color(colors[category, name])
+                if (category, name) in colors
+                else option
+                for name, option in options.items()
+            }
+            for category, options in preferences.items()
+        }
+
+
+def make_variants(preferences: dict, variants: dict) -> Iterable[Tuple[str, dict]]:
+    """Derive every variant from one base theme.
+
+    Args:
+        preferences (dict): Base preferences tree.
+        variants (dict): Variant name to transform settings.
+
+    Yields:
+        Tuple[str, dict]: Each variant's name and preferences tree.
+    """
+    palette = Palette.from_preferences(preferences)
+    for name, settings in variants.items():
+        yield name, palette.apply(settings).to_preferences(preferences)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate theme variants")
+    parser.add_argument("variants", type=str, help="JSON file of variant settings")
+    parser.add_argument("output", type=str, help="directory to write the themes to")
+    parser.add_argument(
+        "-t",
+        "--theme",
+        type=str,
+        default=None,
+        help="theme file to derive from instead of the built-in theme",
+    )
+    args = parser.parse_args()
+
+    from preferences import preferences
+    from themes import dump_theme, get_theme
+
+    base = get_theme(args.theme) if args.theme else preferences
+    with open(args.variants, "r") as fp:
+        variants = json.load(fp)
+    os.makedirs(args.output, exist_ok=True)
+    for variant, variant_preferences in make_variants(base, variants):
+        with open(os.path.join(args.output, f"{variant}.json"), "w") as fp:
+            json.dump(dump_theme(variant_preferences), fp, indent=4)
+            fp.write("\n")
@@ -1,32 +1,117 @@
+"""Dark theme preferences for Ghidra tool configs."""
+from abc import ABC, abstractmethod
 from typing import Tuple
+import xml.etree.ElementTree as ET
+
+# Ghidra option TYPE for each supported value type
+TYPES = {str: "string", bool: "boolean", int: "int"}
+
+
+class Option(ABC):
+    """Immutable option, validated once and able to build its own elements."""
+
+    __slots__ = ()
+    tag = ""
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __reduce__(self):
+        # Frozen instances cannot be restored attribute by attribute
+        return (from_plan, (self.to_plan(),))
+
+    @abstractmethod
+    def element(self, name: str) -> ET.Element:
+        """Build a new XML element for this option.
+
+        Args:
+            name (str): The option's NAME attribute.
+
+        Returns:
+            ET.Element: A fresh element, safe to insert into any tree.
+        """
+
+    @abstractmethod
+    def to_plan(self) -> dict:
+        """Describe this option with plain, JSON serializable values.
+
+        Returns:
+            dict: Input for `from_plan`.
+        """
+
+
+class State(Option):
+    __slots__ = ("name", "value", "type", "_attrib")
+    tag = "STATE"
 
-class State():
     def __init__(self, value, name=""):
-        self.tag = "STATE"
-        self.name = name
-        self.value = str(value)
-        if type(value) == str:
-            self.type = "string"
-        elif type(value) == bool:
-            self.type = "boolean"
-        elif type(value) == int:
-            self.type = "int"
-        else:
-            self.type = "unknown"
-
-class Wrapped():
+        self._init(name, TYPES.get(type(value), "unknown"), str(value))
+
+    def _init(self, name: str, value_type: str, value: str):
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "value", value)
+        object.__setattr__(self, "type", value_type)
+        object.__setattr__(self, "_attrib", {"TYPE": value_type, "VALUE": value})
+
+    def element(self, name: str) -> ET.Element:
+        return ET.Element(self.tag, {"NAME": name, **self._attrib})
+
+    def to_plan(self) -> dict:
+        return {"tag": self.tag, "state": [self.name, self.type, self.value]}
+
+
+class Wrapped(Option):
+    __slots__ = ("states", "_children")
+    tag = "WRAPPED_OPTION"
+    classname = "ghidra.framework.options.WrappedWrapped"
+    # classname to subclass, for `from_plan`
+    classes = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.classname = f"ghidra.framework.options.Wrapped{cls.__name__}"
+        Wrapped.classes[cls.classname] = cls
+
     def __init__(self, *states: Tuple[State]):
-        self.tag = "WRAPPED_OPTION"
-        self.states = states
-        self.classname = "ghidra.framework.options.Wrapped{}".format(self.__class__.__name__)
+        for state in states:
+            if not isinstance(state, State) or not state.name:
+                raise TypeError(f"{type(self).__name__} states must be named State")
+        self._init(states)
+
+    def _init(self, states: Tuple[State]):
+        object.__setattr__(self, "states", states)
+        children = tuple((_.tag, {"NAME": _.name, **_._attrib}) for _ in states)
+        object.__setattr__(self, "_children", children)
+
+    def element(self, name: str) -> ET.Element:
+        e = ET.Element(self.tag, {"NAME": name, "CLASS": self.classname})
+        for tag, attrib in self._children:
+            ET.SubElement(e, tag, attrib)
+        return e
+
+    def to_plan(self) -> dict:
+        return {
+            "tag": self.tag,
+            "class": self.classname,
+            "states": [[_.name, _.type, _.value] for _ in self.states],
+        }
+
 
 class Color(Wrapped):
+    __slots__ = ()
+
     def __init__(self, color: str):
         super().__init__(
-            State(color, "color")    
+            State(color, "color")
         )
 
+
 class Font(Wrapped):
+    __slots__ = ()
+
     def __init__(self, size: int, style: int, family: str):
         super().__init__(
             State(size, "size"),
@@ -34,13 +119,39 @@ class Font(Wrapped):
             State(family, "family")
         )
 
+
 class KeyStroke(Wrapped):
+    __slots__ = ()
+
     def __init__(self, keyCode: int, modifiers: int):
         super().__init__(
             State(keyCode, "KeyCode"),
             State(modifiers, "Modifiers")
         )
 
+def from_plan(plan: dict) -> Option:
+    """Rebuild an option from `Option.to_plan` without validating it again.
+
+    Args:
+        plan (dict): Output of `Option.to_plan`.
+
+    Returns:
+        Option: The option.
+    """
+    if plan["tag"] == State.tag:
+        state = object.__new__(State)
+        state._init(*plan["state"])
+        return state
+    wrapped = object.__new__(Wrapped.classes.get(plan["class"], Wrapped))
+    states = []
+    for name, value_type, value in plan["states"]:
+        state = object.__new__(State)
+        state._init(name, value_type, value)
+        states.append(state)
+    wrapped._init(tuple(states))
+    return wrapped
+
+
 preferences = {
     "Listing Fields": {
         "Cursor Text Highlight.Highlight Color": Color(-13157567),
@@ -0,0 +1,125 @@
+"""Detect running Ghidra instances."""
+import logging
+import os
+from pathlib import Path
+import sys
+
+logger = logging.getLogger(__name__)
+
+
+def _runs_from(cmdline: bytes, install_path: bytes) -> bool:
+    """Check if any argument of a `/proc/<pid>/cmdline` is below `install_path`.
+
+    `install_path` is a real path ending with a separator, arguments are
+    resolved too so that symlinked and relative launch paths still match.
+    """
+    for arg in cmdline.split(b"\0"):
+        if install_path in arg:
+            return True
+        # Class paths and -Dname=path options
+        for part in arg.split(os.fsencode(os.pathsep)):
+            part = part.split(b"=", 1)[-1]
+            if os.path.isabs(part):
+                resolved = os.path.join(os.path.realpath(part), b"")
+                if resolved.startswith(install_path):
+                    return True
+    return False
+
+
+def iter_ghidra_processes(uid: int = None, install_path: str = None):
+    """Lazily scan `/proc` for running Ghidra instances (Linux only).
+
+    Args:
+        uid (int, optional): Only match processes owned by this user. Defaults to None.
+        install_path (str, optional): Only match processes from this install.
+            Defaults to None.
+
+    Yields:
+        int: The owner's uid of each matching process.
+    """
+    if install_path:
+        # A separator after it, so that /opt/ghidra_10.2 is not /opt/ghidra_10.2.3
+        real_path = os.path.realpath(str(install_path))
+        install_path = os.fsencode(os.path.join(real_path, ""))
+    own_pid = str(os.getpid())
+    with os.scandir("/proc") as it:
+        for entry in it:
+            if not entry.name.isdigit() or entry.name == own_pid:
+                continue
+            try:
+                owner = entry.stat().st_uid
+                if uid is not None and owner != uid:
+                    continue
+                with open(os.path.join(entry.path, "cmdline"), "rb") as fp:
+                    cmdline = fp.read()
+            except OSError:
+                # The process exited or is not ours to look at
+                continue
+            if b"ghidrarun" not in cmdline.lower():
+                continue
+            if install_path and not _runs_from(cmdline, install_path):
+                continue
+            yield owner
+
+
+def has_proc() -> bool:
+    """Check if processes can be found through `/proc`.
+
+    Returns:
+        bool: If running on Linux with `/proc` mounted.
+    """
+    return sys.platform.startswith("linux") and os.path.isdir("/proc/self")
+
+
+def get_user_uid(user: str = None, home: str = None) -> int:
+    """Find the uid of `user`, or of the owner of `home`.
+
+    With neither, the owner of the current home directory is used.
+
+    Args:
+        user (str, optional): User name. Defaults to None.
+        home (str, optional): Home directory. Defaults to None.
+
+    Returns:
+        int: The uid, or None if it cannot be determined.
+    """
+    try:
+        if user and not home:
+            import pwd
+
+            return pwd.getpwnam(user).pw_uid
+        return os.stat(home or Path.home()).st_uid
+    except (ImportError, KeyError, OSError):
+        pass
+    return None
+
+
+def is_ghidra_running(uid: int = None, install_path: str = None) -> bool:
+    """Check if `ghidrarun` is running.
+
+    On Linux `/proc` is scanned and the search stops at the first match, other
+    platforms fall back to listing every process and ignore the filters.
+
+    Args:
+        uid (int, optional): Only check processes owned by this user. Defaults to None.
+        install_path (str, optional): Only check processes from this install.
+            Defaults to None.
+
+    Returns:
+        bool: If Ghidra is running.
+    """
+    if has_proc():
+        logger.debug("Scanning /proc")
+        return any(True for _ in iter_ghidra_processes(uid, install_path))
+
+    import subprocess
+
+    if os.name == "nt":
+        find_ghidra = "WMIC path win32_process get Commandline"
+    else:
+        find_ghidra = "ps -ax"
+    out = subprocess.check_output(find_ghidra.split())
+    logger.debug("Running %s", find_ghidra)
+    if b"ghidrarun" in out.lower():
+        return True
+    return False
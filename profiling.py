@@ -0,0 +1,290 @@
+"""Profile install and uninstall runs with cProfile and tracemalloc."""
+import argparse
+from contextlib import contextmanager
+import cProfile
+import io
+import logging
+import pstats
+import threading
+import time
+import tracemalloc
+
+from cache import save_text
+
+logger = logging.getLogger(__name__)
+
+TOP_FUNCTIONS = 25
+TOP_ALLOCATIONS = 15
+TOP_FILE_FUNCTIONS = 5
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser):
+    """Add the profiling option shared by install and uninstall.
+
+    Args:
+        parser (argparse.ArgumentParser): Entry point argument parser.
+    """
+    parser.add_argument(
+        "--profile",
+        type=str,
+        default=None,
+        metavar="PREFIX",
+        help="profile the run, writing PREFIX.pstats and a PREFIX.txt summary",
+    )
+
+
+def _format_size(size: int) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+class _Recorded:
+    """Statistics exported by another process, in a form `pstats` can load"""
+
+    def __init__(self, stats: dict):
+        self._stats = stats
+
+    def create_stats(self):
+        pass
+
+    @property
+    def stats(self) -> dict:
+        return dict(self._stats)
+
+    @stats.setter
+    def stats(self, value: dict):
+        # pstats empties what it loaded, these are loaded more than once
+        pass
+
+
+class Profiler:
+    """Profile of a whole run, with a separate profile for each tool file.
+
+    cProfile only follows the thread that enabled it, so every tool file,
+    which may be handled on a worker thread, gets its own profile. They are
+    merged into the run's profile when it is written, along with the
+    profiles of fleet worker processes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.enabled = False
+        self.profile = None
+        self.files = {}
+        self.started = None
+        self.seconds = None
+        self.memory = None
+        self.snapshot = None
+        # Statistics and peak traced memory merged from other processes
+        self.merged = []
+        self.merged_peak = 0
+
+    def start(self):
+        """Start profiling the calling thread and tracing allocations."""
+        self.files = {}
+        self.merged = []
+        self.merged_peak = 0
+        if self.enabled:
+            # Forked workers inherit the parent's profile
+            self.profile.disable()
+        self.started = time.perf_counter()
+        # And its traces
+        tracemalloc.stop()
+        tracemalloc.start()
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        self.enabled = True
+
+    def stop(self):
+        """Stop profiling, keeping what was recorded."""
+        if not self.enabled:
+            return
+        self.profile.disable()
+        self.seconds = time.perf_counter() - self.started
+        self.memory = tracemalloc.get_traced_memory()
+        # Leave out what the profiler itself allocated
+        self.snapshot = tracemalloc.take_snapshot().filter_traces(
+            [
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, cProfile.__file__),
+                tracemalloc.Filter(False, pstats.__file__),
+                tracemalloc.Filter(False, __file__),
+            ]
+        )
+        tracemalloc.stop()
+        self.enabled = False
+
+    @contextmanager
+    def file(self, path: str):
+        """Attribute the body of a `with` statement to one tool file.
+
+        Args:
+            path (str): Tool file path.
+        """
+        if not self.enabled:
+            yield
+            return
+        main = threading.current_thread() is threading.main_thread()
+        profile = cProfile.Profile()
+        try:
+            if main:
+                self.profile.disable()
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ profiles every thread at once, the run's profile has it
+            profile = None
+            if main:
+                self.profile.enable()
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            cpu_seconds = time.thread_time() - cpu_start
+            seconds = time.perf_counter() - start
+            if profile is not None:
+                profile.disable()
+                if main:
+                    self.profile.enable()
+            with self._lock:
+                entry = self.files.setdefault(
+                    path, {"seconds": 0.0, "cpu_seconds": 0.0, "profiles": []}
+                )
+                entry["seconds"] += seconds
+                entry["cpu_seconds"] += cpu_seconds
+                if profile is not None:
+                    entry["profiles"].append(profile)
+
+    def stats(self, stream=None) -> pstats.Stats:
+        """Merge the run's profile with every tool file's.
+
+        Args:
+            stream (optional): Where `print_stats` prints to. Defaults to None.
+
+        Returns:
+            pstats.Stats: Statistics of the whole run.
+        """
+        stats = pstats.Stats(self.profile, stream=stream)
+        for profile in self.merged:
+            stats.add(profile)
+        for entry in self.files.values():
+            for profile in entry["profiles"]:
+                stats.add(profile)
+        return stats
+
+    def to_dict(self) -> dict:
+        """Stop profiling and export it for another process to `merge`.
+
+        Returns:
+            dict: Picklable statistics, of the run and of each tool file.
+        """
+        self.stop()
+        files = {}
+        for path, entry in self.files.items():
+            profiles = entry["profiles"]
+            files[path] = {
+                "seconds": entry["seconds"],
+                "cpu_seconds": entry["cpu_seconds"],
+                "stats": pstats.Stats(*profiles).stats if profiles else None,
+            }
+        return {
+            "stats": pstats.Stats(self.profile).stats,
+            "peak": self.memory[1],
+            "files": files,
+        }
+
+    def merge(self, data: dict):
+        """Add the statistics exported by another process.
+
+        Args:
+            data (dict): Output of `to_dict`.
+        """
+        with self._lock:
+            self.merged.append(_Recorded(data["stats"]))
+            self.merged_peak = max(self.merged_peak, data["peak"])
+            for path, recorded in data["files"].items():
+                entry = self.files.setdefault(
+                    path, {"seconds": 0.0, "cpu_seconds": 0.0, "profiles": []}
+                )
+                entry["seconds"] += recorded["seconds"]
+                entry["cpu_seconds"] += recorded["cpu_seconds"]
+                if recorded["stats"]:
+                    entry["profiles"].append(_Recorded(recorded["stats"]))
+
+    def summary(self) -> str:
+        """Format the slowest functions, largest allocations and each tool file.
+
+        Returns:
+            str: Plain text summary.
+        """
+        current, peak = self.memory
+        lines = [
+            f"Wall time: {self.seconds:.3f}s",
+            f"Traced memory: {_format_size(current)} at exit, "
+            f"{_format_size(peak)} peak",
+        ]
+        if self.merged:
+            lines.append(
+                f"Traced memory in {len(self.merged)} worker runs: "
+                f"{_format_size(self.merged_peak)} peak"
+            )
+        lines += [
+            "",
+            f"Top {TOP_ALLOCATIONS} allocations by line:",
+        ]
+        for statistic in self.snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+            frame = statistic.traceback[0]
+            lines.append(
+                f"  {_format_size(statistic.size):>10} {statistic.count:>7} blocks"
+                f"  {frame.filename}:{frame.lineno}"
+            )
+
+        lines += ["", "Tool files:"]
+        for path, entry in sorted(self.files.items()):
+            lines.append(
+                f"  {path}: {entry['seconds']:.3f}s wall, "
+                f"{entry['cpu_seconds']:.3f}s CPU"
+            )
+            if not entry["profiles"]:
+                continue
+            stream = io.StringIO()
+            stats = pstats.Stats(*entry["profiles"], stream=stream)
+            stats.sort_stats("tottime").print_stats(TOP_FILE_FUNCTIONS)
+            lines += ["    " + _ for _ in _stats_table(stream.getvalue())]
+        if not self.files:
+            lines.append("  none")
+
+        stream = io.StringIO()
+        stats = self.stats(stream)
+        stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        lines += ["", f"Top {TOP_FUNCTIONS} functions by cumulative time:"]
+        lines += _stats_table(stream.getvalue())
+        return "\n".join(lines) + "\n"
+
+    def write(self, prefix: str):
+        """Stop profiling and write `prefix`.pstats and `prefix`.txt.
+
+        Args:
+            prefix (str): Output path without extension.
+        """
+        self.stop()
+        if self.profile is None:
+            return
+        self.stats().dump_stats(f"{prefix}.pstats")
+        save_text(f"{prefix}.txt", self.summary())
+        logger.debug("Wrote profile to %s.pstats and %s.txt", prefix, prefix)
+
+
+def _stats_table(text: str) -> list:
+    """Keep the table of a `pstats.Stats.print_stats` output."""
+    lines = text.splitlines()
+    for i, line in enumerate(lines):
+        if line.lstrip().startswith("ncalls"):
+            return [_ for _ in lines[i:] if _.strip()]
+    return []
+
+
+profiler = Profiler()
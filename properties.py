@@ -0,0 +1,154 @@
+"""Edit Java properties files, like Ghidra's `preferences` and `launch.properties`.
+
+A file is parsed once, edited in memory and written back only if an edit
+changed it. Untouched lines, comments and line endings are kept as they are.
+"""
+import logging
+import re
+from typing import List
+
+from cache import save_text
+from journal import Journal
+
+logger = logging.getLogger(__name__)
+
+# Key up to the first unescaped separator, then an optional `=` or `:`
+_ENTRY = re.compile(
+    r"\s*((?:\\.|[^\s=:\\])+)[^\S\r\n]*[=:]?[^\S\r\n]*(.*?)\r?\n?\Z", re.S
+)
+# A line ending in an odd number of backslashes continues on the next one
+_CONTINUED = re.compile(r"(?<!\\)(?:\\\\)*\\\r?\n\Z")
+_CONTINUATION = re.compile(r"(?<!\\)(?:\\\\)*\\\r?\n[^\S\r\n]*")
+
+
+class Properties:
+    """A properties file as a list of entries, in file order."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "r", newline="") as fp:
+            lines = fp.read().splitlines(keepends=True)
+        self.newline = "\r\n" if lines and lines[0].endswith("\r\n") else "\n"
+        self.changed = False
+
+        # [key, value, raw text] per logical line, key is None for comments
+        self.entries = []
+        raw = ""
+        for line in lines:
+            raw += line
+            if _CONTINUED.search(raw):
+                continue
+            self.entries.append(self._parse(raw))
+            raw = ""
+        if raw:
+            self.entries.append(self._parse(raw))
+
+    @staticmethod
+    def _parse(raw: str) -> list:
+        stripped = raw.lstrip()
+        if not stripped or stripped[0] in "#!":
+            return [None, None, raw]
+        match = _ENTRY.match(_CONTINUATION.sub("", raw))
+        if not match:
+            return [None, None, raw]
+        return [match.group(1), match.group(2), raw]
+
+    def get(self, key: str) -> str:
+        """Find the value of `key`.
+
+        Args:
+            key (str): Property name.
+
+        Returns:
+            str: The last value, as Java reads it, or None if it is not set.
+        """
+        values = self.get_all(key)
+        return values[-1] if values else None
+
+    def get_all(self, key: str) -> List[str]:
+        """Find every value of a key that is repeated, like `VMARGS`.
+
+        Args:
+            key (str): Property name.
+
+        Returns:
+            List[str]: The values, in file order.
+        """
+        return [value for name, value, _ in self.entries if name == key]
+
+    def _append(self, key: str, value: str):
+        if self.entries and not self.entries[-1][2].endswith(("\n", "\r")):
+            self.entries[-1][2] += self.newline
+        self.entries.append([key, value, f"{key}={value}{self.newline}"])
+        self.changed = True
+
+    def set(self, key: str, value: str):
+        """Set `key` to `value`, replacing its last entry in place or appending one.
+
+        Args:
+            key (str): Property name.
+            value (str): New value.
+        """
+        entries = [_ for _ in self.entries if _[0] == key]
+        if not entries:
+            self._append(key, value)
+        elif entries[-1][1] != value:
+            entry = entries[-1]
+            newline = re.search(r"\r?\n?\Z", entry[2]).group(0)
+            entry[1:] = [value, f"{key}={value}{newline}"]
+            self.changed = True
+
+    def add(self, key: str, value: str):
+        """Add a `key` entry with `value`, unless there already is one.
+
+        Args:
+            key (str): Property name, may be repeated.
+            value (str): Value to add.
+        """
+        if value not in self.get_all(key):
+            self._append(key, value)
+
+    def remove(self, key: str, value: str = None):
+        """Remove every `key` entry, or only the ones set to `value`.
+
+        Args:
+            key (str): Property name.
+            value (str, optional): Only remove entries with this value.
+                Defaults to None.
+        """
+        entries = [
+            _
+            for _ in self.entries
+            if _[0] != key or (value is not None and _[1] != value)
+        ]
+        if len(entries) != len(self.entries):
+            self.entries = entries
+            self.changed = True
+
+    def text(self) -> str:
+        """Render the file.
+
+        Returns:
+            str: The file contents with every edit applied.
+        """
+        return "".join(raw for _, _, raw in self.entries)
+
+    def save(self, journal: Journal = None) -> bool:
+        """Atomically write the file back, if anything changed.
+
+        Args:
+            journal (Journal, optional): Stage the new contents in this journal
+                instead of writing them. Defaults to None.
+
+        Returns:
+            bool: If anything changed.
+        """
+        if not self.changed:
+            return False
+        if journal is not None:
+            journal.stage_text(self.path, self.text())
+        else:
+            save_text(self.path, self.text())
+        logger.debug("Updated %s", self.path)
+        self.changed = False
+        return True
@@ -0,0 +1,240 @@
+"""Report whether Ghidra dark theme is installed, without changing anything."""
+import argparse
+import json
+import logging
+import os
+from pathlib import Path
+import sys
+
+from discovery import add_discovery_arguments, list_config_dirs, select_installs
+import fleet
+
+
+logger = logging.getLogger(__name__)
+
+
+def install_status(install_path: str) -> dict:
+    """Check the FlatLaf side of an installation.
+
+    Args:
+        install_path (str): Ghidra install path.
+
+    Returns:
+        dict: If the FlatLaf jar is present and set in `launch.properties`.
+    """
+    from flatlaf import FlatLaf, SYSTEM_LAF
+    from properties import Properties
+
+    try:
+        launch_properties = Properties(
+            os.path.join(install_path, "support", "launch.properties")
+        )
+        vmargs = launch_properties.get_all("VMARGS")
+    except OSError:
+        vmargs = None
+    return {
+        "install": str(install_path),
+        "flatlaf": os.path.exists(FlatLaf().get_path(install_path)),
+        "launch_properties": None if vmargs is None else SYSTEM_LAF in vmargs,
+    }
+
+
+def config_status(config_path: str, theme_preferences: dict) -> dict:
+    """Check the preferences and tool files of a config.
+
+    Tool files whose fingerprint is current are not read at all, others only
+    have their OPTIONS parsed.
+
+    Args:
+        config_path (str): Ghidra config path.
+        theme_preferences (dict): Category to option name to option.
+
+    Returns:
+        dict: If `preferences` uses the system L&f, and for each tool file
+            that exists, if it has every theme value.
+    """
+    from fingerprints import Fingerprints
+    from properties import Properties
+    from tcd_browser import TCD_LIST, StreamingTCDBrowser, list_tool_files
+    from xml.parsers.expat import ExpatError
+
+    try:
+        ghidra_preferences = Properties(os.path.join(config_path, "preferences"))
+        look_and_feel = ghidra_preferences.get("LastLookAndFeel") == "System"
+    except OSError:
+        look_and_feel = None
+
+    tools = {}
+    present = list_tool_files(config_path)
+    fingerprints = Fingerprints(config_path, theme_preferences)
+    for tcd in TCD_LIST:
+        if tcd not in present:
+            continue
+        tcd_path = os.path.join(config_path, "tools", tcd)
+        if fingerprints.is_current(tcd_path):
+            tools[tcd] = True
+            continue
+        try:
+            matching, total = StreamingTCDBrowser(tcd_path).compare(theme_preferences)
+        except (OSError, SyntaxError, ValueError, ExpatError) as e:
+            logger.warning("Could not read %s: %s", tcd_path, e)
+            tools[tcd] = None
+            continue
+        logger.debug("%s has %d of %d theme values", tcd_path, matching, total)
+        tools[tcd] = matching == total
+    return {"config": config_path, "preferences": look_and_feel, "tools": tools}
+
+
+def is_themed(status: dict) -> bool:
+    """Check if a status from `install_status` or `config_status` is fully themed.
+
+    Args:
+        status (dict): Install or config status.
+
+    Returns:
+        bool: If nothing is missing.
+    """
+    if "install" in status:
+        return bool(status["flatlaf"] and status["launch_properties"])
+    return bool(
+        status["preferences"]
+        and status["tools"].get("_code_browser.tcd")
+        and all(status["tools"].values())
+    )
+
+
+def find_configs(home: str, version: str) -> list:
+    """Find every config directory variant for `version` in `home`.
+
+    Args:
+        home (str): Home directory.
+        version (str): Ghidra version.
+
+    Returns:
+        list: Config paths.
+    """
+    return [
+        os.path.join(home, ".ghidra", _)
+        for _ in list_config_dirs(home)
+        if _.startswith(f".ghidra_{version}_") or _ == f".ghidra-{version}"
+    ]
+
+
+def print_status(status: dict):
+    """Print a status from `install_status` or `config_status`.
+
+    Args:
+        status (dict): Install or config status.
+    """
+
+    def line(name, value, yes, no):
+        print(f"  {name:18} {'missing' if value is None else (yes if value else no)}")
+
+    if "install" in status:
+        line("FlatLaf", status["flatlaf"], "installed", "missing")
+        line("launch.properties", status["launch_properties"], "set", "not set")
+        return
+    print(status["config"])
+    line("preferences", status["preferences"], "set", "not set")
+    for tcd, themed in status["tools"].items():
+        line(tcd, themed, "themed", "not themed")
+
+
+def status_all(args: argparse.Namespace) -> bool:
+    """Report the status of the selected Ghidra installations and users
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+
+    Returns:
+        bool: If everything is themed.
+    """
+    if args.theme:
+        from themes import get_theme
+
+        try:
+            theme_preferences = get_theme(args.theme)
+        except (OSError, ValueError, ImportError) as e:
+            logging.error("Could not load theme: %s", e)
+            sys.exit(-1)
+    else:
+        from preferences import preferences as theme_preferences
+
+    installs = select_installs(args)
+
+    if fleet.is_fleet(args):
+        homes = fleet.get_fleet_homes(args.users, args.homes)
+    elif args.user:
+        homes = [os.path.expanduser(f"~{args.user}")]
+    else:
+        homes = [str(Path.home())]
+
+    ok = True
+    for ghidra_install_path, ghidra_version in installs:
+        statuses = [install_status(ghidra_install_path)]
+        for home in homes:
+            statuses += [
+                config_status(_, theme_preferences)
+                for _ in find_configs(home, ghidra_version)
+            ]
+
+        if not args.json:
+            print(f"Ghidra v{ghidra_version} ({ghidra_install_path})")
+        for status in statuses:
+            status["themed"] = is_themed(status)
+            ok = status["themed"] and ok
+            if args.json:
+                print(json.dumps(status))
+            else:
+                print_status(status)
+    return ok
+
+
+def main(args: argparse.Namespace):
+    """Report the status of Ghidra dark theme
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+    """
+    if args.debug:
+        level = logging.DEBUG
+    else:
+        level = logging.WARNING
+    logging.basicConfig(level=level, format="%(levelname)s: %(message)s")
+
+    if not status_all(args):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Report whether Ghidra dark theme is installed"
+    )
+    parser.add_argument(
+        "-d", "--debug", action="store_true", help="turn on debug logging"
+    )
+    parser.add_argument(
+        "-p",
+        "--path",
+        dest="install_path",
+        type=str,
+        default=None,
+        help="the installation path for Ghidra",
+    )
+    parser.add_argument(
+        "-u", "--user", type=str, default=None, help="the user to check"
+    )
+    parser.add_argument(
+        "-t",
+        "--theme",
+        type=str,
+        default=None,
+        help="JSON or TOML theme file to check for instead of the built-in theme",
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="print one JSON object per line"
+    )
+    add_discovery_arguments(parser)
+    fleet.add_fleet_arguments(parser, parallel=False)
+
+    main(parser.parse_args())
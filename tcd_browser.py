@@ -1,8 +1,14 @@
 """Represents _code_browser.tcd"""
-import sys
+import io
+import mmap
+import os
+import re
+import shutil
+import tempfile
+from typing import BinaryIO, Callable, Dict, List, Set, Tuple
 import xml.etree.ElementTree as ET
-import xml.dom.minidom as MD
-from preferences import Wrapped
+from xml.parsers import expat
+from preferences import State, Wrapped
 
 TCD_LIST = [
     "_code_browser.tcd",
@@ -12,11 +18,141 @@ TCD_LIST = [
     "Version Tracking (SOURCE TOOL).tool",
 ]
 
+# Tool files from this size on only have their OPTIONS parsed and rewritten
+STREAMING_MIN_BYTES = 4 * 1024 * 1024
+
+# A start tag, skipping `>` inside quoted attribute values
+_START_TAG = re.compile(rb"<[^>\"']*(?:(?:\"[^\"]*\"|'[^']*')[^>\"']*)*>")
+_VALUE = re.compile(rb"\sVALUE\s*=\s*(?:\"([^\"]*)\"|'([^']*)')")
+INDENT = "    "
+
+# Upper bound on tool files handled at once, mostly waiting on (network) I/O
+MAX_TOOL_FILE_WORKERS = 8
+
+
+def list_tool_files(config_path: str) -> Set[str]:
+    """Find which files in `TCD_LIST` exist, with a single directory listing.
+
+    Args:
+        config_path (str): Ghidra config path.
+
+    Returns:
+        Set[str]: The tool file names that exist.
+    """
+    try:
+        with os.scandir(os.path.join(config_path, "tools")) as it:
+            return {_.name for _ in it if _.name in TCD_LIST and _.is_file()}
+    except (FileNotFoundError, NotADirectoryError):
+        return set()
+
+
+def for_each_tool_file(
+    job: Callable[[str], None], tcds: List[str] = None
+) -> Dict[str, BaseException]:
+    """Run `job` for every file in `TCD_LIST` concurrently.
+
+    Args:
+        job (Callable[[str], None]): Called with each file name.
+        tcds (List[str], optional): Only these files. Defaults to `TCD_LIST`.
+
+    Returns:
+        Dict[str, BaseException]: The error raised for each file that failed.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    tcds = TCD_LIST if tcds is None else tcds
+    if not tcds:
+        return {}
+    workers = min(len(tcds), MAX_TOOL_FILE_WORKERS)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {tcd: executor.submit(job, tcd) for tcd in tcds}
+    return {
+        tcd: future.exception()
+        for tcd, future in futures.items()
+        if future.exception() is not None
+    }
+
+def _escape(data: str, attribute: bool = False) -> str:
+    """Escape character data the same way Ghidra's own writer does"""
+    data = data.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    if attribute:
+        data = data.replace("\"", "&quot;").replace("\n", "&#10;")
+        data = data.replace("\r", "&#13;").replace("\t", "&#9;")
+    return data
+
+
+def _serialize(write, elem):
+    """Write `elem` and its children in a single pass"""
+    write("<" + elem.tag)
+    for name, value in elem.attrib.items():
+        write(' %s="%s"' % (name, _escape(value, True)))
+    if len(elem) or elem.text:
+        write(">")
+        if elem.text:
+            write(_escape(elem.text))
+        for child in elem:
+            _serialize(write, child)
+            if child.tail:
+                write(_escape(child.tail))
+        write("</%s>" % elem.tag)
+    else:
+        write("/>")
+
+
+def _is_set(value: str, state: State) -> bool:
+    """Check if a VALUE attribute already holds the value of `state`"""
+    if state.type == "boolean" and value is not None:
+        # Ghidra writes booleans back in lower case
+        return value.lower() == state.value.lower()
+    return value == state.value
+
+
+def _matches(element: ET.Element, option) -> bool:
+    """Check if an option element holds the values of `option`"""
+    if isinstance(option, Wrapped):
+        values = {_.get("NAME"): _.get("VALUE") for _ in element.iter()}
+        return all(_is_set(values.get(_.name), _) for _ in option.states)
+    return _is_set(element.get("VALUE"), option)
+
+
+def _write_like(source: str, output: str, body: Callable[[BinaryIO], None]) -> int:
+    """Write `output` atomically with `body`, giving it the mode and owner of `source`.
+
+    Returns:
+        int: Bytes written.
+    """
+    directory, name = os.path.split(os.path.abspath(output))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+    try:
+        with open(fd, "wb") as f:
+            body(f)
+        size = os.path.getsize(tmp_path)
+        # Keep the owner when installing as root for another user
+        st = os.stat(source)
+        os.chmod(tmp_path, st.st_mode & 0o7777)
+        if hasattr(os, "chown"):
+            try:
+                os.chown(tmp_path, st.st_uid, st.st_gid)
+            except PermissionError:
+                pass
+        os.replace(tmp_path, output)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return size
+
+
 class TCDBrowser:
     def __init__(self, path: str) -> None:
         self.path = path
         tree = ET.parse(path)
         self.root = tree.getroot()
+        # Indentation level of `root`
+        self.level = 0
+        # Statistics of the last `update` and `write`
+        self.added = 0
+        self.updated = 0
+        self.bytes_written = 0
 
     def _indent(self, elem, level=0):
         """Spacing fixup after adding new things"""
@@ -34,56 +170,437 @@ class TCDBrowser:
             if level and (not elem.tail or not elem.tail.strip()):
                 elem.tail = i
 
-    def update(self, preferences):
-        # List comprehensions instead of a ton of nested statements
-        tool = [_ for _ in self.root.iter() if _.tag == "TOOL"][0]
-        tool_options = [_ for _ in tool.iter() if _.tag == "OPTIONS"][0]
-        categories = [_ for _ in tool_options.iter() if _.tag == "CATEGORY" and "NAME" in _.attrib]
+    def _index(self, tool_options):
+        """Map (category, option name) to the first matching element, in one pass"""
+        categories = {}
+        options = {}
+        for category in tool_options.iter("CATEGORY"):
+            name = category.get("NAME")
+            if name is None:
+                continue
+            categories.setdefault(name, []).append(category)
+            for element in category.iter():
+                if element is not category and "NAME" in element.attrib:
+                    options.setdefault((category, element.get("NAME")), element)
+        return categories, options
+
+    def _tool_options(self):
+        tool = self.root if self.root.tag == "TOOL" else self.root.find(".//TOOL")
+        return tool.find(".//OPTIONS")
+
+    def compare(self, preferences) -> Tuple[int, int]:
+        """Count the theme's options that are already set, without changing anything.
+
+        Args:
+            preferences (dict): Category to option name to option.
+
+        Returns:
+            Tuple[int, int]: Options set to the theme's values, and options in
+                the theme.
+        """
+        categories, options = self._index(self._tool_options())
+        matching = 0
+        total = 0
+        for name, values in preferences.items():
+            for preference, option in values.items():
+                total += 1
+                elements = [
+                    options.get((category, preference))
+                    for category in categories.get(name, [])
+                ]
+                if elements and all(
+                    e is not None and _matches(e, option) for e in elements
+                ):
+                    matching += 1
+        return matching, total
+
+    def update(self, preferences, output: str = None):
+        tool_options = self._tool_options()
+        categories, options = self._index(tool_options)
+        self.added = 0
+        self.updated = 0
 
         # Add missing category tags
-        names = [_.get("NAME") for _ in categories]
         for category in preferences.keys():
-            if category not in names:
-                c = ET.Element("CATEGORY")
+            if category not in categories:
+                c = ET.SubElement(tool_options, "CATEGORY")
                 c.set("NAME", category)
-                tool_options.insert(sys.maxsize, c)
-
-        # Remake the categories list in case we added new ones
-        categories = [_ for _ in tool_options.iter() if _.tag == "CATEGORY" and "NAME" in _.attrib]
+                categories[category] = [c]
 
-        for category in categories:
-            for preference, option in preferences.get(category.get("NAME"), {}).items():
-                element = [_ for _ in category.iter() if _.get("NAME") == preference]
+        for name, elements in categories.items():
+            for category in elements:
+                for preference, option in preferences.get(name, {}).items():
+                    element = options.get((category, preference))
 
-                # Check if the preference exists or not
-                if len(element) == 0:
-                    e = ET.Element(option.tag)
-                    e.set("NAME", preference)
+                    # Check if the preference exists or not
+                    if element is None:
+                        e = option.element(preference)
+                        category.append(e)
+                        options[(category, preference)] = e
+                        self.added += 1
 
-                    if isinstance(option, Wrapped):
-                        e.set("CLASS", option.classname)
+                    elif isinstance(option, Wrapped):
+                        if not _matches(element, option):
+                            self.updated += 1
+                        states = {}
+                        for e in element.iter():
+                            states.setdefault(e.get("NAME"), e)
                         for state in option.states:
-                            s = ET.SubElement(e, state.tag)
-                            s.set("NAME", state.name)
-                            s.set("TYPE", state.type)
-                            s.set("VALUE", state.value)
+                            states[state.name].set("VALUE", state.value)
                     else:
-                        e.set("TYPE", option.type)
-                        e.set("VALUE", option.value)
+                        if not _matches(element, option):
+                            self.updated += 1
+                        element.set("VALUE", option.value)
 
-                    category.insert(sys.maxsize, e)
+        self._indent(self.root, self.level)
+        self.write(output)
 
-                else:
-                    element = element[0]
-                    if isinstance(option, Wrapped):
-                        for state in option.states:
-                            e = [_ for _ in element.iter() if _.get("NAME") == state.name][0]
-                            e.set("VALUE", state.value)
-                    else:
-                        element.set("VALUE", option.value)
+    def write(self, output: str = None):
+        """Serialize the tree to a temporary file and atomically replace `output`
+
+        `output` defaults to `path`, and gets the same mode and owner as `path`.
+        """
+
+        def body(f):
+            text = io.TextIOWrapper(f, encoding="UTF-8", newline="")
+            text.write('<?xml version="1.0" encoding="UTF-8"?>')
+            _serialize(text.write, self.root)
+            text.flush()
+            text.detach()
+
+        self.bytes_written = _write_like(self.path, output or self.path, body)
+
+
+class _Found(Exception):
+    pass
+
+
+def _tag_end(fp: BinaryIO, offset: int) -> int:
+    """Find the offset just past the tag starting at `offset`, skipping quoted `>`"""
+    fp.seek(offset)
+    quote = None
+    while True:
+        chunk = fp.read(4096)
+        if not chunk:
+            raise ValueError("unterminated tag")
+        for i, c in enumerate(chunk):
+            if quote:
+                if c == quote:
+                    quote = None
+            elif c in b"\"'":
+                quote = c
+            elif c == ord(">"):
+                return offset + i + 1
+        offset += len(chunk)
+
+
+def find_tool_options(path: str) -> Tuple[int, int, int]:
+    """Locate the OPTIONS of the first TOOL without building a tree.
+
+    The file is parsed only up to the end of OPTIONS.
+
+    Args:
+        path (str): Tool file path.
+
+    Returns:
+        Tuple[int, int, int]: Start and end byte offsets of the OPTIONS element,
+            and its depth in the document.
+    """
+    parser = expat.ParserCreate()
+    stack = []
+    found = {}
+
+    def start(name, attrs):
+        if name == "OPTIONS" and "tool" in found and "start" not in found:
+            found["start"] = parser.CurrentByteIndex
+            found["depth"] = len(stack)
+        elif name == "TOOL" and "tool" not in found:
+            found["tool"] = len(stack)
+        stack.append(name)
+
+    def end(name):
+        stack.pop()
+        if "start" in found and len(stack) == found["depth"]:
+            found["end"] = parser.CurrentByteIndex
+            raise _Found()
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    with open(path, "rb") as fp:
+        try:
+            for chunk in iter(lambda: fp.read(1 << 16), b""):
+                parser.Parse(chunk, False)
+            parser.Parse(b"", True)
+        except _Found:
+            end = _tag_end(fp, found["start"])
+            fp.seek(end - 2)
+            if fp.read(2) != b"/>":
+                end = _tag_end(fp, found["end"])
+            return found["start"], end, found["depth"]
+    raise ValueError(f"{path} has no TOOL/OPTIONS")
+
+
+class StreamingTCDBrowser(TCDBrowser):
+    """Patch only the OPTIONS of a tool file, copying the rest byte for byte.
+
+    Memory use is proportional to the options, not to the whole file, which
+    can be tens of MB of saved layouts.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.start, self.end, self.level = find_tool_options(path)
+        with open(path, "rb") as fp:
+            fp.seek(self.start)
+            self.root = ET.fromstring(fp.read(self.end - self.start))
+        self.added = 0
+        self.updated = 0
+        self.bytes_written = 0
+
+    def _tool_options(self):
+        return self.root
+
+    def write(self, output: str = None):
+        """Write the patched OPTIONS between the original bytes around them
+
+        `output` defaults to `path`, and gets the same mode and owner as `path`.
+        """
+
+        def body(f):
+            with open(self.path, "rb") as source:
+                remaining = self.start
+                while remaining:
+                    chunk = source.read(min(remaining, 1 << 16))
+                    if not chunk:
+                        raise ValueError(f"{self.path} changed while streaming")
+                    f.write(chunk)
+                    remaining -= len(chunk)
+                text = io.TextIOWrapper(f, encoding="UTF-8", newline="")
+                _serialize(text.write, self.root)
+                text.flush()
+                text.detach()
+                source.seek(self.end)
+                shutil.copyfileobj(source, f, 1 << 16)
+
+        self.bytes_written = _write_like(self.path, output or self.path, body)
+
+
+class SplicingTCDBrowser(TCDBrowser):
+    """Patch a tool file in place, keeping Ghidra's own layout.
+
+    Only the VALUE attributes that differ are rewritten and missing options
+    are inserted, every other byte is copied as is. The byte offsets of each
+    option are recorded while parsing the OPTIONS through a read-only mmap.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        # Element to [start offset, end tag offset or None if empty, depth]
+        self.spans = {}
+        self.edits = []
+        with open(path, "rb") as fp, mmap.mmap(
+            fp.fileno(), 0, access=mmap.ACCESS_READ
+        ) as data:
+            self.size = len(data)
+            self.root = self._parse(data)
+            newline = data.find(b"\n")
+            self.newline = "\r\n" if newline > 0 and data[newline - 1] == 13 else "\n"
+        self.added = 0
+        self.updated = 0
+        self.bytes_written = 0
+
+    def _parse(self, data) -> ET.Element:
+        """Build the OPTIONS of the first TOOL, recording where each element is"""
+        parser = expat.ParserCreate()
+        stack = []
+        elements = []
+        found = {}
+
+        def start(name, attrs):
+            if elements:
+                element = ET.SubElement(elements[-1], name, attrs)
+            elif name == "OPTIONS" and "tool" in found:
+                element = ET.Element(name, attrs)
+                found["root"] = element
+            else:
+                if name == "TOOL" and "tool" not in found:
+                    found["tool"] = len(stack)
+                stack.append(name)
+                return
+            self.spans[element] = [parser.CurrentByteIndex, None, len(stack)]
+            stack.append(name)
+            elements.append(element)
+
+        def end(name):
+            stack.pop()
+            if not elements:
+                return
+            element = elements.pop()
+            span = self.spans[element]
+            if not _START_TAG.match(data, span[0]).group(0).endswith(b"/>"):
+                span[1] = parser.CurrentByteIndex
+            if element is found.get("root"):
+                raise _Found()
+
+        parser.StartElementHandler = start
+        parser.EndElementHandler = end
+        try:
+            for offset in range(0, len(data), 1 << 16):
+                parser.Parse(data[offset : offset + (1 << 16)], False)
+            parser.Parse(b"", True)
+        except _Found:
+            return found["root"]
+        raise ValueError(f"{self.path} has no TOOL/OPTIONS")
+
+    def _tool_options(self):
+        return self.root
+
+    def _set(self, data, element: ET.Element, state: State) -> bool:
+        """Replace (or add) the VALUE attribute of `element`, if it differs
+
+        Returns:
+            bool: If it differed.
+        """
+        if _is_set(element.get("VALUE"), state):
+            return False
+        value = state.value
+        element.set("VALUE", value)
+        if element not in self.spans:
+            # Inserted by this update, written out whole
+            return True
+        tag = _START_TAG.match(data, self.spans[element][0])
+        match = _VALUE.search(data, tag.start(), tag.end())
+        if match:
+            quoted = 1 if match.group(1) is not None else 2
+            escaped = _escape(value, True)
+            if quoted == 2:
+                escaped = escaped.replace("'", "&apos;")
+            self.edits.append(
+                (match.start(quoted), match.end(quoted), escaped.encode("UTF-8"))
+            )
+        else:
+            end = tag.end() - (2 if tag.group(0).endswith(b"/>") else 1)
+            while data[end - 1 : end].isspace():
+                end -= 1
+            attribute = f' VALUE="{_escape(value, True)}"'
+            self.edits.append((end, end, attribute.encode("UTF-8")))
+        return True
+
+    def _append(self, data, parent: ET.Element, children: List[ET.Element]):
+        """Insert new `children` at the end of `parent`, indented like Ghidra"""
+        start, end, depth = self.spans[parent]
+        text = io.StringIO()
+        for child in children:
+            parent.append(child)
+            self._indent(child, depth + 1)
+            text.write("\n" + INDENT * (depth + 1))
+            _serialize(text.write, child)
+        body = text.getvalue()
+
+        if end is None:
+            # `<CATEGORY NAME="..." />` becomes a start and end tag
+            tag = _START_TAG.match(data, start)
+            head = tag.group(0)[:-2].rstrip() + b">"
+            closing = "\n" + INDENT * depth + f"</{parent.tag}>"
+            replacement = head + (body + closing).replace("\n", self.newline).encode()
+            self.edits.append((tag.start(), tag.end(), replacement))
+            return
+        # Before the whitespace leading up to the end tag
+        while data[end - 1 : end].isspace():
+            end -= 1
+        self.edits.append((end, end, body.replace("\n", self.newline).encode("UTF-8")))
+
+    def update(self, preferences, output: str = None):
+        categories, options = self._index(self.root)
+        self.added = 0
+        self.updated = 0
+        self.edits = []
+
+        with open(self.path, "rb") as fp, mmap.mmap(
+            fp.fileno(), 0, access=mmap.ACCESS_READ
+        ) as data:
+            if len(data) != self.size:
+                raise ValueError(f"{self.path} changed while patching")
+
+            # Add missing category tags, with all of their options
+            missing = []
+            for name, values in preferences.items():
+                if name not in categories:
+                    category = ET.Element("CATEGORY", {"NAME": name})
+                    for preference, option in values.items():
+                        category.append(option.element(preference))
+                        self.added += 1
+                    missing.append(category)
+            if missing:
+                self._append(data, self.root, missing)
+
+            for name, elements in categories.items():
+                for category in elements:
+                    added = []
+                    for preference, option in preferences.get(name, {}).items():
+                        element = options.get((category, preference))
+
+                        # Check if the preference exists or not
+                        if element is None:
+                            e = option.element(preference)
+                            added.append(e)
+                            options[(category, preference)] = e
+                            self.added += 1
+
+                        elif isinstance(option, Wrapped):
+                            states = {}
+                            for e in element.iter():
+                                states.setdefault(e.get("NAME"), e)
+                            changed = [
+                                self._set(data, states[state.name], state)
+                                for state in option.states
+                            ]
+                            if any(changed):
+                                self.updated += 1
+                        elif self._set(data, element, option):
+                            self.updated += 1
+                    if added:
+                        self._append(data, category, added)
+
+            self.write(output, data)
+
+    def write(self, output: str = None, data=None):
+        """Copy the file with every edit spliced in, in a single atomic write
+
+        `output` defaults to `path`, and gets the same mode and owner as `path`.
+        """
+        if data is None:
+            with open(self.path, "rb") as fp, mmap.mmap(
+                fp.fileno(), 0, access=mmap.ACCESS_READ
+            ) as data:
+                return self.write(output, data)
+
+        def body(f):
+            position = 0
+            with memoryview(data) as view:
+                for start, end, replacement in sorted(self.edits, key=lambda _: _[:2]):
+                    f.write(view[position:start])
+                    f.write(replacement)
+                    position = end
+                f.write(view[position:])
+
+        self.bytes_written = _write_like(self.path, output or self.path, body)
+
+
+def open_tool_file(path: str, splice: bool = False) -> TCDBrowser:
+    """Open a tool file, streaming it if it is large.
+
+    Args:
+        path (str): Tool file path.
+        splice (bool, optional): Patch only the values that changed, keeping
+            the file's layout. Defaults to False.
 
-        self._indent(self.root)
-    
-        xmlstr = MD.parseString(ET.tostring(self.root)).toprettyxml(indent="", newl="", encoding="UTF-8")
-        with open(self.path, "wb") as f:
-            f.write(xmlstr)
+    Returns:
+        TCDBrowser: A `SplicingTCDBrowser` if `splice`, otherwise a
+            `StreamingTCDBrowser` from `STREAMING_MIN_BYTES` up.
+    """
+    if splice:
+        return SplicingTCDBrowser(path)
+    if os.path.getsize(path) >= STREAMING_MIN_BYTES:
+        return StreamingTCDBrowser(path)
+    return TCDBrowser(path)
@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from journal import STAGED_SUFFIX, Journal
+
+
+def read(path):
+    with open(path, "r") as fp:
+        return fp.read()
+
+
+def write(path, text):
+    with open(path, "w") as fp:
+        fp.write(text)
+
+
+class JournalTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.preferences = os.path.join(self.directory, "preferences")
+        self.tool = os.path.join(self.directory, "tool.tcd")
+        write(self.preferences, "LastLookAndFeel=Metal\n")
+        write(self.tool, "<TOOL/>\n")
+
+    def install(self, preferences, tool):
+        journal = Journal(self.directory)
+        journal.recover()
+        journal.stage_text(self.preferences, preferences)
+        journal.stage_text(self.tool, tool)
+        return journal
+
+
+class InterruptedCommitTest(JournalTestCase):
+    def crash_between_renames(self, journal):
+        replace = os.replace
+        renamed = []
+
+        def crashing_replace(source, dest):
+            if source.endswith(STAGED_SUFFIX):
+                if renamed:
+                    raise KeyboardInterrupt()
+                renamed.append(dest)
+            replace(source, dest)
+
+        with mock.patch("journal.os.replace", crashing_replace):
+            with self.assertRaises(KeyboardInterrupt):
+                journal.commit()
+
+    def test_recover_restores_versions_from_before_the_commit(self):
+        self.install("LastLookAndFeel=System\n", "<TOOL dark='1'/>\n").commit()
+        # Ghidra keeps writing to the files between installs
+        edited = "LastLookAndFeel=System\nRecentProjects2=/important\n"
+        write(self.preferences, edited)
+
+        journal = self.install("LastLookAndFeel=System\n", "<TOOL dark='2'/>\n")
+        self.crash_between_renames(journal)
+
+        Journal(self.directory).recover()
+        self.assertEqual(read(self.preferences), edited)
+        self.assertEqual(read(self.tool), "<TOOL dark='1'/>\n")
+        self.assertFalse(os.path.exists(self.preferences + STAGED_SUFFIX))
+        self.assertFalse(os.path.exists(self.tool + STAGED_SUFFIX))
+
+        # Uninstall still goes back to before the first install
+        journal = Journal(self.directory)
+        self.assertTrue(journal.exists())
+        journal.restore()
+        self.assertEqual(read(self.preferences), "LastLookAndFeel=Metal\n")
+        self.assertEqual(read(self.tool), "<TOOL/>\n")
+
+    def test_recover_from_first_install_forgets_the_journal(self):
+        journal = self.install("LastLookAndFeel=System\n", "<TOOL dark='1'/>\n")
+        self.crash_between_renames(journal)
+
+        journal = Journal(self.directory)
+        journal.recover()
+        self.assertEqual(read(self.preferences), "LastLookAndFeel=Metal\n")
+        self.assertEqual(read(self.tool), "<TOOL/>\n")
+        self.assertFalse(journal.exists())
+        self.assertFalse(Journal(self.directory).exists())
+
+
+class RestoreTest(JournalTestCase):
+    def test_restore_leaves_excluded_files_alone(self):
+        self.install("LastLookAndFeel=System\n", "<TOOL dark='1'/>\n").commit()
+        edited = "LastLookAndFeel=System\nRecentProjects2=/important\n"
+        write(self.preferences, edited)
+
+        Journal(self.directory).restore(exclude=[self.preferences])
+        self.assertEqual(read(self.preferences), edited)
+        self.assertEqual(read(self.tool), "<TOOL/>\n")
+        self.assertFalse(Journal(self.directory).exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,242 @@
+"""Load themes from JSON/TOML files and cache them as compiled patch plans.
+
+A theme file maps category names to option names to values, e.g.::
+
+    {
+        "Decompiler": {
+            "Display.Background Color": {"color": "#282828"},
+            "Display.Font": {"font": [14, 0, "Monospaced"]}
+        },
+        "Comments": {"Enter accepts comment": true}
+    }
+
+Colors are signed 32-bit ARGB ints as Ghidra stores them, or "#RRGGBB" /
+"#AARRGGBB" strings. Fonts are [size, style, family] and key strokes are
+[key code, modifiers]. Plain strings, bools and ints become STATE options.
+"""
+import argparse
+import functools
+import hashlib
+import json
+import os
+
+from cache import get_cache_dir, load_json, save_json
+from preferences import Color, Font, KeyStroke, Option, State, from_plan
+
+# Bump when the plan layout or the theme file format changes
+PLAN_VERSION = 1
+
+
+def parse_color(value) -> int:
+    """Turn a theme color into Ghidra's signed 32-bit ARGB int.
+
+    Args:
+        value (int or str): ARGB int, "#RRGGBB" or "#AARRGGBB".
+
+    Returns:
+        int: Signed ARGB value.
+    """
+    if isinstance(value, str) and value.startswith("#") and len(value) in (7, 9):
+        argb = int(value[1:], 16)
+        if len(value) == 7:
+            argb |= 0xFF000000
+    elif isinstance(value, int) and not isinstance(value, bool):
+        argb = value & 0xFFFFFFFF
+    else:
+        raise ValueError(f"invalid color {value!r}")
+    return argb - (1 << 32) if argb & 0x80000000 else argb
+
+
+def parse_option(value) -> Option:
+    """Turn a theme file value into an option.
+
+    Args:
+        value: Value from the theme file.
+
+    Returns:
+        Option: The validated option.
+    """
+    if isinstance(value, dict) and len(value) == 1:
+        kind, arguments = next(iter(value.items()))
+        types = [type(_) for _ in arguments] if isinstance(arguments, list) else None
+        if kind == "color":
+            return Color(parse_color(arguments))
+        if kind == "font" and types == [int, int, str]:
+            return Font(*arguments)
+        if kind == "keystroke" and types == [int, int]:
+            return KeyStroke(*arguments)
+    elif isinstance(value, (str, bool, int)):
+        return State(value)
+    raise ValueError(f"invalid option {value!r}")
+
+
+def read_theme_file(path: str) -> dict:
+    """Read a JSON or TOML (by `.toml` suffix) theme file.
+
+    Args:
+        path (str): Theme file path.
+
+    Returns:
+        dict: The raw theme.
+    """
+    with open(path, "rb") as fp:
+        data = fp.read()
+    if path.endswith(".toml"):
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise ImportError("TOML themes need Python >=3.11 or `tomli`")
+        return tomllib.loads(data.decode("utf-8"))
+    return json.loads(data.decode("utf-8"))
+
+
+def load_theme(path: str) -> dict:
+    """Load and validate a theme file.
+
+    Args:
+        path (str): Theme file path.
+
+    Returns:
+        dict: Category to option name to option, like `preferences.preferences`.
+    """
+    theme = read_theme_file(path)
+    if not isinstance(theme, dict):
+        raise ValueError(f"{path}: expected a table of categories")
+    preferences = {}
+    for category, options in theme.items():
+        if not isinstance(options, dict):
+            raise ValueError(f"{path}: category {category!r} must be a table")
+        for name, value in options.items():
+            try:
+                preferences.setdefault(category, {})[name] = parse_option(value)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"{path}: {category}/{name}: {e}") from e
+    return preferences
+
+
+def dump_theme(preferences: dict) -> dict:
+    """Turn preferences into a theme that `load_theme` reads back.
+
+    Args:
+        preferences (dict): Category to option name to option.
+
+    Returns:
+        dict: JSON serializable theme.
+    """
+    theme = {}
+    for category, options in preferences.items():
+        for name, option in options.items():
+            if isinstance(option, Color):
+                value = {"color": int(option.states[0].value)}
+            elif isinstance(option, (Font, KeyStroke)):
+                kind = type(option).__name__.lower()
+                value = {
+                    kind: [
+                        int(_.value) if _.type == "int" else _.value
+                        for _ in option.states
+                    ]
+                }
+            elif isinstance(option, State) and option.type == "boolean":
+                value = option.value == "True"
+            elif isinstance(option, State) and option.type == "int":
+                value = int(option.value)
+            elif isinstance(option, State):
+                value = option.value
+            else:
+                raise ValueError(f"cannot export {category}/{name}")
+            theme.setdefault(category, {})[name] = value
+    return theme
+
+
+def compile_plan(preferences: dict, source_sha256: str = None) -> dict:
+    """Compile preferences into a ready-to-apply patch plan.
+
+    Args:
+        preferences (dict): Category to option name to option.
+        source_sha256 (str, optional): Hash of the theme file it came from.
+
+    Returns:
+        dict: JSON serializable plan listing every category, option name,
+            classname and state value `TCDBrowser.update` needs.
+    """
+    return {
+        "version": PLAN_VERSION,
+        "source_sha256": source_sha256,
+        "categories": [
+            {
+                "name": category,
+                "options": [[name, _.to_plan()] for name, _ in options.items()],
+            }
+            for category, options in preferences.items()
+        ],
+    }
+
+
+def plan_to_preferences(plan: dict) -> dict:
+    """Rebuild preferences from a compiled plan without validating them again.
+
+    Args:
+        plan (dict): Output of `compile_plan`.
+
+    Returns:
+        dict: Category to option name to option.
+    """
+    return {
+        category["name"]: {name: from_plan(_) for name, _ in category["options"]}
+        for category in plan["categories"]
+    }
+
+
+def get_theme(path: str, cache_dir: str = None) -> dict:
+    """Load a theme, going through its cached plan when the file is unchanged.
+
+    Plans are stored by the SHA-256 of the theme file, so editing the file
+    invalidates its plan. Results are also kept for the life of the process,
+    by the same hash, so long running watches pick up edits too.
+
+    Args:
+        path (str): Theme file path.
+        cache_dir (str, optional): Plan cache directory. Defaults to the user cache.
+
+    Returns:
+        dict: Category to option name to option.
+    """
+    with open(path, "rb") as fp:
+        digest = hashlib.sha256(fp.read()).hexdigest()
+    cache_dir = cache_dir or os.path.join(get_cache_dir(), "themes")
+    return _get_theme(digest, path, cache_dir)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_theme(digest: str, path: str, cache_dir: str) -> dict:
+    """Load the version of a theme with the SHA-256 `digest`"""
+    plan_path = os.path.join(cache_dir, f"{digest}.json")
+
+    plan = load_json(plan_path)
+    if plan.get("version") == PLAN_VERSION and plan.get("source_sha256") == digest:
+        try:
+            return plan_to_preferences(plan)
+        except (KeyError, TypeError, ValueError):
+            pass
+
+    preferences = load_theme(path)
+    try:
+        save_json(plan_path, compile_plan(preferences, digest))
+    except OSError:
+        pass
+    return preferences
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the built-in theme")
+    parser.add_argument("output", type=str, help="JSON file to write the theme to")
+    args = parser.parse_args()
+
+    from preferences import preferences
+
+    with open(args.output, "w") as fp:
+        json.dump(dump_theme(preferences), fp, indent=4)
+        fp.write("\n")
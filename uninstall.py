@@ -1,43 +1,41 @@
 """Uninstall Ghidra dark theme."""
 import argparse
-import fileinput
+import functools
 import logging
 import os
 import sys
 
 from install import (
     is_ghidra_running,
-    get_ghidra_version,
-    get_ghidra_install_path,
+    get_user_uid,
     get_ghidra_config_path,
 )
-from tcd_browser import TCD_LIST
+from discovery import add_discovery_arguments, select_installs
+from tcd_browser import TCD_LIST, for_each_tool_file
 from flatlaf import FlatLaf
+from fingerprints import remove_fingerprints
+from journal import Journal
+from locking import DEFAULT_TIMEOUT, LockTimeout, add_lock_arguments, lock_directory
+from properties import Properties
+import fleet
+from metrics import add_metrics_arguments, metrics
+from profiling import add_profile_arguments, profiler
 
 
 logger = logging.getLogger(__name__)
 
-def remove_dark_preferences(config_path: str):
-    """Restore preference files from backups.
+
+def _restore_tool_file(config_path: str, tcd: str):
+    """Restore one tool file from its backup.
 
     Args:
         config_path (str): Ghidra config path.
+        tcd (str): Tool file name from `TCD_LIST`.
     """
-    preferences_path = os.path.join(config_path, "preferences")
-    if not os.path.exists(preferences_path):
-        logging.error("Please open Ghidra at least once to fully install dark mode.")
-        sys.exit(-1)
-
-    with fileinput.FileInput(preferences_path, inplace=True) as fp:
-        for line in fp:
-            if "LastLookAndFeel=System" not in line:
-                print(line, end="")
-            else:
-                logging.debug("Restored %s", preferences_path)
-
-    for tcd in TCD_LIST:
-        tcd_path = os.path.join(config_path, "tools", tcd)
-        backup_path = os.path.join(config_path, "tools", f"{tcd}.bak")
+    tcd_path = os.path.join(config_path, "tools", tcd)
+    backup_path = os.path.join(config_path, "tools", f"{tcd}.bak")
+    labels = {"config": config_path, "file": tcd}
+    with metrics.span("file_seconds", **labels), profiler.file(tcd_path):
         if os.path.exists(tcd_path) and not os.path.exists(backup_path):
             logger.warning("Could not restore %s", tcd_path)
         elif os.path.exists(backup_path):
@@ -48,6 +46,127 @@ def remove_dark_preferences(config_path: str):
             logger.debug("Could not restore %s", tcd_path)
 
 
+def remove_dark_preferences(config_path: str, lock_timeout: float = DEFAULT_TIMEOUT):
+    """Restore preference files from the journal, or from backups.
+
+    Args:
+        config_path (str): Ghidra config path.
+        lock_timeout (float, optional): Seconds to wait for another run on the
+            config path. Defaults to `DEFAULT_TIMEOUT`.
+
+    Raises:
+        LockTimeout: If another run kept the config path locked.
+    """
+    preferences_path = os.path.join(config_path, "preferences")
+    if not os.path.exists(preferences_path):
+        logging.error("Please open Ghidra at least once to fully install dark mode.")
+        sys.exit(-1)
+
+    with lock_directory(config_path, lock_timeout):
+        journal = Journal(config_path)
+        journaled = journal.exists()
+        if journaled:
+            labels = {"config": config_path, "file": "journal"}
+            with metrics.span("file_seconds", **labels), profiler.file(journal.path):
+                # Ghidra keeps writing preferences, only the install's key goes
+                journal.restore(exclude=[preferences_path])
+
+        ghidra_preferences = Properties(preferences_path)
+        ghidra_preferences.remove("LastLookAndFeel", "System")
+        if ghidra_preferences.save():
+            logging.debug("Restored %s", preferences_path)
+
+        remove_fingerprints(config_path)
+        if journaled:
+            logger.debug("Restored %s from its journal", config_path)
+            return
+
+        # Installed by a version without the journal
+        errors = for_each_tool_file(functools.partial(_restore_tool_file, config_path))
+        for tcd in TCD_LIST:
+            if tcd in errors:
+                logger.error("Could not restore %s: %s", tcd, errors[tcd])
+        if errors:
+            sys.exit(-1)
+
+
+def uninstall_theme(
+    args: argparse.Namespace, ghidra_install_path: str, ghidra_version: str
+) -> bool:
+    """Uninstall Ghidra dark theme for one Ghidra installation
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+        ghidra_install_path (str): Ghidra install path.
+        ghidra_version (str): Ghidra version of the installation.
+
+    Returns:
+        bool: If every user was restored.
+    """
+    span = functools.partial(
+        metrics.span, "phase_seconds", install=str(ghidra_install_path)
+    )
+    if fleet.is_fleet(args):
+        homes = fleet.get_fleet_homes(args.users, args.homes)
+        config_paths = {
+            home: get_ghidra_config_path(ghidra_version, home=home) for home in homes
+        }
+        with span(phase="process_detection"):
+            config_paths, blocked = fleet.exclude_running(
+                config_paths, ghidra_install_path
+            )
+    else:
+        with span(phase="process_detection"):
+            running = is_ghidra_running(get_user_uid(args.user), ghidra_install_path)
+        if running:
+            logger.error("Please close any running Ghidra instances.")
+            return False
+        ghidra_config_path = get_ghidra_config_path(ghidra_version, args.user)
+        logging.debug("Using Ghidra config path %s", ghidra_config_path)
+
+    logging.debug("Removing FlatLaf...")
+    try:
+        with span(phase="flatlaf"):
+            flatlaf = FlatLaf(lock_timeout=args.lock_timeout)
+            flatlaf.remove(ghidra_install_path)
+
+        logging.debug("Removing dark preferences...")
+        with span(phase="preferences"):
+            if fleet.is_fleet(args):
+                action = functools.partial(
+                    remove_dark_preferences, lock_timeout=args.lock_timeout
+                )
+                results = fleet.run_fleet(action, config_paths, args.jobs)
+                return fleet.log_summary(blocked + results)
+            remove_dark_preferences(ghidra_config_path, args.lock_timeout)
+    except LockTimeout as e:
+        logger.error("%s, try again once it is done.", e)
+        return False
+    return True
+
+
+def uninstall_all(args: argparse.Namespace) -> bool:
+    """Uninstall Ghidra dark theme for the selected Ghidra installations
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+
+    Returns:
+        bool: If every installation and user succeeded.
+    """
+    installs = select_installs(args)
+
+    ok = True
+    for ghidra_install_path, ghidra_version in installs:
+        logging.debug("Using Ghidra install path %s", ghidra_install_path)
+        logging.debug("Found Ghidra v%s", ghidra_version)
+        if args.all and fleet.is_fleet(args):
+            print(f"Ghidra v{ghidra_version} ({ghidra_install_path})")
+        ok = uninstall_theme(args, ghidra_install_path, ghidra_version) and ok
+
+    return ok
+
+
 def main(args: argparse.Namespace):
     """Uninstall Ghidra dark theme
 
@@ -60,28 +179,18 @@ def main(args: argparse.Namespace):
         level = logging.WARNING
     logging.basicConfig(level=level, format="%(levelname)s: %(message)s")
 
-    if is_ghidra_running():
-        logger.error("Please close any running Ghidra instances.")
-        sys.exit(-1)
-
-    ghidra_install_path = get_ghidra_install_path(args.install_path)
-    if not ghidra_install_path:
-        logging.error("Could not find Ghidra installation, specify with --path")
+    if args.profile:
+        profiler.start()
+    try:
+        ok = uninstall_all(args)
+    finally:
+        if args.metrics:
+            metrics.write(args.metrics, args.metrics_format)
+        if args.profile:
+            profiler.write(args.profile)
+
+    if not ok:
         sys.exit(-1)
-    logging.debug("Using Ghidra install path %s", ghidra_install_path)
-
-    ghidra_version = get_ghidra_version(ghidra_install_path)
-    logging.debug("Found Ghidra v%s", ghidra_version)
-
-    ghidra_config_path = get_ghidra_config_path(ghidra_version, args.user)
-    logging.debug("Using Ghidra config path %s", ghidra_config_path)
-
-    logging.debug("Removing FlatLaf...")
-    flatlaf = FlatLaf()
-    flatlaf.remove(ghidra_install_path)
-
-    logging.debug("Removing dark preferences...")
-    remove_dark_preferences(ghidra_config_path)
 
 
 if __name__ == "__main__":
@@ -100,5 +209,10 @@ if __name__ == "__main__":
     parser.add_argument(
         "-u", "--user", type=str, default=None, help="the user to install for"
     )
+    add_discovery_arguments(parser)
+    add_metrics_arguments(parser)
+    add_profile_arguments(parser)
+    add_lock_arguments(parser)
+    fleet.add_fleet_arguments(parser)
 
     main(parser.parse_args())
@@ -0,0 +1,252 @@
+"""Watch a Ghidra config and re-apply the theme when Ghidra rewrites it.
+
+Changes are picked up with inotify on Linux and by polling elsewhere. Bursts
+of writes are debounced, and nothing is touched while Ghidra is running.
+"""
+import argparse
+import logging
+import os
+import select
+import struct
+import time
+from typing import Callable, Dict, Iterable, List, Set
+
+from locking import LockTimeout
+from tcd_browser import TCD_LIST
+
+logger = logging.getLogger(__name__)
+
+DEBOUNCE_SECONDS = 2.0
+POLL_SECONDS = 5.0
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct("iIII")
+
+
+def add_watch_arguments(parser: argparse.ArgumentParser):
+    """Add the watch mode options.
+
+    Args:
+        parser (argparse.ArgumentParser): Entry point argument parser.
+    """
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep running and re-apply the theme whenever Ghidra rewrites it",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=DEBOUNCE_SECONDS,
+        metavar="SECONDS",
+        help=f"wait for writes to settle this long (default: {DEBOUNCE_SECONDS})",
+    )
+
+
+class InotifyWatcher:
+    """Report writes to files with inotify, watching their directories."""
+
+    def __init__(self, files: List[str]):
+        import ctypes
+        import ctypes.util
+
+        name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(name, use_errno=True)
+        self._libc.inotify_add_watch.argtypes = [
+            ctypes.c_int,
+            ctypes.c_char_p,
+            ctypes.c_uint32,
+        ]
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # Directory to the names watched in it
+        self.files = {}
+        for path in files:
+            directory, name = os.path.split(path)
+            self.files.setdefault(directory, set()).add(name)
+        self.watches = {}
+        for directory in self.files:
+            self._add_watch(directory)
+
+    def _add_watch(self, directory: str) -> bool:
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), mask)
+        if wd < 0:
+            # Not created yet, added once it shows up in a watched directory
+            logger.debug("Could not watch %s", directory)
+            return False
+        self.watches[wd] = directory
+        logger.debug("Watching %s", directory)
+        return True
+
+    def read(self, timeout: float = None) -> Set[str]:
+        """Wait for writes.
+
+        Args:
+            timeout (float, optional): Seconds to wait, forever if None.
+
+        Returns:
+            Set[str]: Watched files written since the last call.
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+            directory = self.watches.get(wd)
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+            if path in self.files and path not in self.watches.values():
+                # A watched directory showed up, everything in it is new
+                if self._add_watch(path):
+                    changed.update(os.path.join(path, _) for _ in self.files[path])
+            elif name in self.files[directory]:
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Report writes to files by comparing their stats every `interval`."""
+
+    def __init__(self, files: List[str], interval: float = POLL_SECONDS):
+        self.files = files
+        self.interval = interval
+        self.stats = self._stat_all()
+
+    def _stat_all(self) -> Dict[str, tuple]:
+        stats = {}
+        for path in self.files:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            stats[path] = (st.st_ino, st.st_size, st.st_mtime_ns)
+        return stats
+
+    def read(self, timeout: float = None) -> Set[str]:
+        """Wait for writes.
+
+        Args:
+            timeout (float, optional): Seconds to wait at most. Defaults to
+                `interval`.
+
+        Returns:
+            Set[str]: Watched files written since the last call.
+        """
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        stats = self._stat_all()
+        changed = {
+            path for path, st in stats.items() if self.stats.get(path) != st
+        }
+        self.stats = stats
+        return changed
+
+    def close(self):
+        pass
+
+
+def open_watcher(files: List[str], interval: float = POLL_SECONDS):
+    """Watch `files` with inotify if possible, otherwise by polling.
+
+    Args:
+        files (List[str]): Paths to watch, they do not need to exist yet.
+        interval (float, optional): Polling interval. Defaults to `POLL_SECONDS`.
+
+    Returns:
+        InotifyWatcher or PollingWatcher: The watcher.
+    """
+    try:
+        return InotifyWatcher(files)
+    except (OSError, AttributeError) as e:
+        logger.debug("inotify is not available (%s), polling instead", e)
+    return PollingWatcher(files, interval)
+
+
+def watch(
+    config_path: str,
+    apply: Callable[[List[str]], None],
+    is_running: Callable[[], bool],
+    debounce: float = DEBOUNCE_SECONDS,
+    interval: float = POLL_SECONDS,
+    pending: Iterable[str] = None,
+):
+    """Re-apply the theme to every file Ghidra writes, until interrupted.
+
+    Args:
+        config_path (str): Ghidra config path.
+        apply (Callable[[List[str]], None]): Called with the names of the tool
+            files from `TCD_LIST` to re-apply, empty if only `preferences` changed.
+        is_running (Callable[[], bool]): Checks if Ghidra is running.
+        debounce (float, optional): Seconds without writes before applying.
+            Defaults to `DEBOUNCE_SECONDS`.
+        interval (float, optional): Seconds between polls and between checks
+            for Ghidra exiting. Defaults to `POLL_SECONDS`.
+        pending (Iterable[str], optional): Files to re-apply right away.
+            Defaults to None.
+    """
+    tools_path = os.path.join(config_path, "tools")
+    files = [os.path.join(config_path, "preferences")]
+    files += [os.path.join(tools_path, tcd) for tcd in TCD_LIST]
+    watcher = open_watcher(files, interval)
+    pending = set(pending or ())
+    deadline = time.monotonic() if pending else None
+    logger.info("Watching %s", config_path)
+    try:
+        while True:
+            if deadline is None:
+                timeout = None
+            else:
+                timeout = max(deadline - time.monotonic(), 0)
+            changed = watcher.read(timeout)
+            if changed:
+                logger.debug("Changed: %s", ", ".join(sorted(changed)))
+                pending |= changed
+                deadline = time.monotonic() + debounce
+                continue
+            if not pending or time.monotonic() < deadline:
+                continue
+            if is_running():
+                logger.debug("Ghidra is running, waiting for it to exit")
+                deadline = time.monotonic() + interval
+                continue
+
+            tcds = [
+                tcd
+                for tcd in TCD_LIST
+                if os.path.join(tools_path, tcd) in pending
+                and os.path.exists(os.path.join(tools_path, tcd))
+            ]
+            pending = set()
+            deadline = None
+            try:
+                apply(tcds)
+            except SystemExit:
+                # The reason was logged, try again on the next write
+                pass
+            except LockTimeout as e:
+                logger.warning("%s, trying again on the next write", e)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()